@@ -0,0 +1,232 @@
+"""Command execution of lndmanage.
+
+This module is only imported after the command line was parsed successfully,
+such that help output and argument errors don't pay for importing the lnd
+interface (grpc, networkx, numpy).
+"""
+import os
+import time
+# readline has a desired side effect on keyword input of enabling history
+import readline
+
+from lndmanage.lib.fee_setting import FeeSetter
+from lndmanage.lib.info import Info
+from lndmanage.lib.listings import ListChannels, ListPeers
+from lndmanage.lib.lncli import Lncli
+from lndmanage.lib.node import LndNode
+from lndmanage.lib.openchannels import ChannelOpener
+from lndmanage.lib.recommend_nodes import RecommendNodes
+from lndmanage.lib.report import Report
+
+from lndmanage import settings
+
+import logging
+logger = logging.getLogger()
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+async def run_commands(parser, node, args):
+    # program execution
+    if args.loglevel:
+        # update the loglevel of the stdout handler to the user choice
+        logger.handlers[0].setLevel(args.loglevel)
+
+    if args.cmd == 'status':
+        node.print_status()
+
+    elif args.cmd == 'listchannels':
+        listchannels = ListChannels(node)
+        if not args.subcmd:
+            listchannels.print_all_channels('rev_alias')
+        if args.subcmd == 'rebalance':
+            listchannels.print_channels_unbalanced(
+                args.unbalancedness, sort_string=args.sort_by)
+        elif args.subcmd == 'inactive':
+            listchannels.print_channels_inactive(
+                sort_string=args.sort_by)
+        elif args.subcmd == 'forwardings':
+            # convert time interval into unix timestamp
+            now = time.time()
+            time_from = now - args.from_days_ago * SECONDS_PER_DAY
+            time_to = now - args.to_days_ago * SECONDS_PER_DAY
+            logger.info(
+                f"Forwardings from {args.from_days_ago} days ago"
+                f" to {args.to_days_ago} days ago are included.")
+            listchannels.print_channels_forwardings(
+                time_interval_start=time_from, time_interval_end=time_to,
+                sort_string=args.sort_by)
+        elif args.subcmd == 'hygiene':
+            time_from = time.time() - args.from_days_ago * SECONDS_PER_DAY
+            logger.info(f"Channel hygiene stats is over last "
+                        f"{args.from_days_ago} days.")
+            listchannels.print_channels_hygiene(
+                time_interval_start=time_from, sort_string=args.sort_by)
+
+    elif args.cmd == 'listpeers':
+        listpeers = ListPeers(node)
+        time_to = time.time()
+        time_from = time_to - args.from_days_ago * SECONDS_PER_DAY
+        logger.info(
+            f"Forwardings from {args.from_days_ago} days ago"
+            f" to now are included.")
+        if not args.subcmd:
+            listpeers.print_all_nodes(
+                time_interval_start=time_from,
+                time_interval_end=time_to,
+                sort_string=args.sort_by,
+            )
+        elif args.subcmd == 'in':
+            listpeers.print_all_nodes(
+                time_interval_start=time_from,
+                time_interval_end=time_to,
+                sort_string='in',
+            )
+        elif args.subcmd == 'out':
+            listpeers.print_all_nodes(
+                time_interval_start=time_from,
+                time_interval_end=time_to,
+                sort_string='out',
+            )
+
+    elif args.cmd == 'recommend-nodes':
+        if not args.subcmd:
+            parser.parser_recommend_nodes.print_help()
+            return 0
+
+        recommend_nodes = RecommendNodes(
+            node, show_connected=args.show_connected,
+            show_addresses=args.show_addresses)
+
+        if args.subcmd == 'good-old':
+            recommend_nodes.print_good_old(number_of_nodes=args.nnodes,
+                                           sort_by=args.sort_by)
+        elif args.subcmd == 'flow-analysis':
+            recommend_nodes.print_flow_analysis(
+                out_direction=(not args.inwards),
+                number_of_nodes=args.nnodes,
+                forwarding_events=args.forwarding_events,
+                sort_by=args.sort_by)
+        elif args.subcmd == 'external-source':
+            recommend_nodes.print_external_source(
+                args.source, distributing_nodes=args.distributing_nodes,
+                number_of_nodes=args.nnodes, sort_by=args.sort_by)
+        elif args.subcmd == 'channel-openings':
+            recommend_nodes.print_channel_openings(
+                from_days_ago=args.from_days_ago,
+                number_of_nodes=args.nnodes, sort_by=args.sort_by)
+        elif args.subcmd == 'second-neighbors':
+            recommend_nodes.print_second_neighbors(
+                number_of_nodes=args.nnodes, sort_by=args.sort_by)
+
+    elif args.cmd == 'report':
+        now = time.time()
+        time_from = now - args.from_days_ago * SECONDS_PER_DAY
+        time_to = now - args.to_days_ago * SECONDS_PER_DAY
+        report = Report(node, time_from, time_to)
+        report.report()
+
+    elif args.cmd == 'info':
+        info = Info(node)
+        info.parse_and_print(args.info_string)
+
+    elif args.cmd == 'openchannels':
+        channel_opener = ChannelOpener(node)
+        try:
+            channel_opener.open_channels(
+                pubkeys=args.pubkeys,
+                amounts=args.amounts,
+                sat_per_vbyte=args.sat_per_vbyte,
+                total_amount=args.total_amount,
+                private=args.private,
+            )
+        except Exception as e:
+            logger.info(e)
+    elif args.cmd == 'update-fees':
+        # optimization parameters given on the command line override the
+        # defaults for this run only
+        overrides = {
+            parameter: value for parameter, value in (
+                ('cltv', args.cltv),
+                ('min_base_fee', args.min_base_fee_msat),
+                ('max_base_fee', args.max_base_fee_msat),
+                ('min_fee_rate', args.min_fee_rate),
+                ('max_fee_rate', args.max_fee_rate),
+                ('r_t', args.target_forwarding_amount_sat),
+            ) if value is not None
+        }
+
+        feesetter = FeeSetter(
+            node,
+            from_days_ago=args.from_days_ago,
+            parameters=overrides
+        )
+
+        feesetter.set_fees(
+            init=args.init,
+            reckless=args.reckless
+        )
+
+
+async def execute(parser, args):
+    """Runs a single command given by the parsed arguments args."""
+    lndnode = LndNode(config_file=settings.config_file)
+    async with lndnode:
+        await run_commands(parser, lndnode, args)
+
+
+async def interactive(parser):
+    """Runs lndmanage in interactive mode, reading commands from stdin."""
+    history_file = os.path.join(settings.home_dir, "command_history")
+    try:
+        readline.read_history_file(history_file)
+    except FileNotFoundError:
+        # history will be written later
+        pass
+
+    logger.info("Running in interactive mode. "
+                "You can type 'help' or 'exit'.")
+
+    lndnode = LndNode(config_file=settings.config_file)
+    async with lndnode:
+        if parser.lncli_path:
+            logger.info("> Enabled lncli: using " + parser.lncli_path)
+
+        while True:
+            try:
+                user_input = input("$ lndmanage ")
+            except KeyboardInterrupt:
+                logger.info("")
+                continue
+            except EOFError:
+                readline.write_history_file(history_file)
+                logger.info("exit")
+                return 0
+
+            if not user_input or user_input in ['help', '-h', '--help']:
+                parser.parser.print_help()
+                continue
+            elif user_input == 'exit':
+                readline.write_history_file(history_file)
+                return 0
+
+            args_list = user_input.split(" ")
+
+            # lncli execution
+            if args_list[0] == 'lncli':
+                if parser.lncli_path:
+                    lncli = Lncli(parser.lncli_path, settings.config_file)
+                    lncli.lncli(args_list[1:])
+                    continue
+                else:
+                    logger.info("lncli not enabled, put lncli in PATH or in ~/.lndmanage")
+                    continue
+            try:
+                # need to run with parse_known_args to get an exception
+                args = parser.parser.parse_args(args_list)
+                await run_commands(parser, lndnode, args)
+            except SystemExit:
+                # argparse may raise SystemExit on incorrect user input,
+                # which is a graceful exit. The user gets the standard output
+                # from argparse of what went wrong.
+                continue
@@ -1,5 +1,7 @@
 import os
+import re
 import configparser
+from importlib.resources import files
 
 from lndmanage.lib.user import yes_no_question, get_user_input
 
@@ -7,7 +9,12 @@ import logging
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
-this_file_path = os.path.dirname(os.path.realpath(__file__))
+# raw values of parsed configurations by path, together with the file's
+# modification time and size
+_CONFIG_CACHE = {}
+
+# host:port, where an IPv6 host is given in brackets, e.g. '[::1]:10009'
+HOST_PATTERN = re.compile(r'^(\[[0-9a-fA-F:]+\]|[^:\[\]]+):(\d{1,5})$')
 
 
 def valid_path(path):
@@ -20,12 +27,44 @@ def valid_path(path):
 
 
 def valid_host(host):
+    match = HOST_PATTERN.match(host)
+    if match and 0 < int(match.group(2)) <= 65535:
+        return host
+    print("Error: Host is not of format '127.0.0.1:10009'")
+    return False
+
+
+def load_config(config_path):
+    """
+    Reads a configuration file. The file is only parsed again if it was
+    modified, each call returns a new configuration object, such that changes
+    to it don't affect other callers.
+
+    :param config_path: path to the configuration file
+    :type config_path: str
+    :return: parsed configuration
+    :rtype: configparser.ConfigParser
+    """
     try:
-        ip, port = host.split(':')
-    except ValueError:
-        print("Error: Host is not of format '127.0.0.1:10009'")
-        return False
-    return host
+        stat = os.stat(config_path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        file_key = None
+
+    cached = _CONFIG_CACHE.get(config_path)
+    if cached is not None and cached[0] == file_key:
+        values = cached[1]
+    else:
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        values = {'DEFAULT': config.defaults()}
+        for section in config.sections():
+            values[section] = dict(config.items(section, raw=True))
+        _CONFIG_CACHE[config_path] = (file_key, values)
+
+    config = configparser.ConfigParser()
+    config.read_dict(values)
+    return config
 
 
 def check_or_create_configuration(home_dir):
@@ -35,6 +74,12 @@ def check_or_create_configuration(home_dir):
     :param home_dir: lndmanage home directory
     :type home_dir: str
     """
+    config_path = os.path.join(home_dir, 'config.ini')
+
+    # the usual case, lndmanage was already configured
+    if os.path.isfile(config_path):
+        return
+
     if not os.path.exists(home_dir):  # user runs for the first time
         print("Running lndmanage for the first time.")
         print(f"Creating configuration folder at {home_dir}.")
@@ -57,19 +102,17 @@ def check_or_create_configuration(home_dir):
             print(
                 f"IF LND RUNS ON A REMOTE HOST, CONFIGURE {home_dir}/config.ini.")
 
-        # build config file
-        config = configparser.ConfigParser()
+        # build config file, the template values are copied verbatim
+        config = configparser.ConfigParser(interpolation=None)
         os.mkdir(home_dir)
-        config_template_path = os.path.join(
-            this_file_path, '../templates/config_sample.ini')
-        config.read(config_template_path)
+        config_template = files('lndmanage').joinpath(
+            'templates/config_sample.ini')
+        config.read_string(config_template.read_text())
 
         config['network']['lnd_grpc_host'] = str(lnd_grpc_host)
         config['network']['macaroon_file'] = str(macaroon_path)
         config['network']['tls_cert_file'] = str(tls_cert_path)
 
-        config_path = os.path.join(home_dir, 'config.ini')
-
         with open(config_path, 'w') as configfile:
             config.write(configfile)
         print(f'Config file was written to {config_path}.')
@@ -77,8 +120,6 @@ def check_or_create_configuration(home_dir):
             exit(0)
 
     else:
-        config_path = os.path.join(home_dir, 'config.ini')
-        if not os.path.isfile(config_path):
-            raise FileNotFoundError(
-                f"Configuration file does not exist. Filename: {config_path}. "
-                f"Delete .lndmanage folder and run again.")
+        raise FileNotFoundError(
+            f"Configuration file does not exist. Filename: {config_path}. "
+            f"Delete .lndmanage folder and run again.")
@@ -1,6 +1,7 @@
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import Tuple
+from functools import lru_cache
+from typing import NamedTuple, Tuple
 
 
 class AddressType(Enum):
@@ -21,7 +22,7 @@ class UTXO:
         self.sort_index = self.amount_sat
 
     def __hash__(self):
-        return hash(self.txid) + hash(self.output_index)
+        return hash((self.txid, self.output_index))
 
     def __eq__(self, other: "UTXO"):
         if self.txid == other.txid and self.output_index == other.output_index:
@@ -38,28 +39,43 @@ class NodeProperties:
     age: int
     local_fee_rates: list
     local_base_fees: list
-    local_balances: list
+    local_balance: int
+    max_local_balance: int
     number_active_channels: int
     number_channels: int
     number_private_channels: int
-    public_capacities: list
-    private_capacites: list
+    capacity: int
+    max_public_capacity: int
     remote_fee_rates: list
     remote_base_fees: list
-    remote_balances: list
+    remote_balance: int
+    max_remote_balance: int
     sent_received_per_week: int
 
 
+@lru_cache(maxsize=65536)
+def _make_pair(key_a: str, key_b: str) -> Tuple[str, str]:
+    """Orders two node keys, the same pairs are constructed repeatedly while
+    iterating the channel graph."""
+    # node keys are hex strings, for which lower() equals casefold()
+    if key_a.lower() < key_b.lower():
+        return key_a, key_b
+    else:
+        return key_b, key_a
+
+
 class NodePair(tuple):
     """Represents a node pair mapped to a fixed order."""
 
     def __new__(cls, keys: Tuple[str, str]):
-        if keys[0].casefold() < keys[1].casefold():
-            seq = (keys[0], keys[1])
-        else:
-            seq = (keys[1], keys[0])
+        return super().__new__(cls, _make_pair(keys[0], keys[1]))
+
 
-        return super().__new__(cls, seq)
+class FeePolicy(NamedTuple):
+    """A channel fee policy to be set."""
+    base_fee_msat: int
+    fee_rate_ppm: int
+    cltv: int
 
 
 class NodeID(str):
@@ -3,7 +3,9 @@ class RouteWithTooSmallCapacity(Exception):
 
 
 class PaymentFailure(Exception):
-    pass
+    def __init__(self, payment=None):
+        self.payment = payment
+        super().__init__()
 
 
 class DryRun(Exception):
@@ -63,36 +65,35 @@ class RouterRPCError(RPCError):
 
 
 class TemporaryChannelFailure(PaymentFailure):
-    def __init__(self, payment):
-        self.payment = payment
-        super().__init__()
+    pass
 
 
 class TemporaryNodeFailure(PaymentFailure):
-    def __init__(self, payment):
-        self.payment = payment
-        super().__init__()
+    pass
 
 
 class UnknownNextPeer(PaymentFailure):
-    def __init__(self, payment):
-        self.payment = payment
-        super().__init__()
+    pass
 
 
 class FeeInsufficient(PaymentFailure):
-    def __init__(self, payment):
-        self.payment = payment
-        super().__init__()
+    pass
 
 
 class IncorrectCLTVExpiry(PaymentFailure):
-    def __init__(self, payment):
-        self.payment = payment
-        super().__init__()
+    pass
 
 
 class ChannelDisabled(PaymentFailure):
-    def __init__(self, payment):
-        self.payment = payment
-        super().__init__()
+    pass
+
+
+class PolicyUpdateFailure(Exception):
+    def __init__(self, failures=None):
+        """
+        :param failures: channel point -> error of the failed policy updates
+        """
+        self.failures = failures or {}
+        super().__init__(
+            f"Failed to update the fee policy of channels "
+            f"{', '.join(self.failures)}.")
@@ -1,13 +1,17 @@
 from configparser import NoSectionError
+from dataclasses import dataclass, fields
 import json
 import logging
 import os
 import time
-from typing import Tuple, List, TYPE_CHECKING, Optional
+from typing import Tuple, List, TYPE_CHECKING, Optional, Union
+
+import numpy as np
 
 if TYPE_CHECKING:
     from lndmanage.lib.node import LndNode
 
+from lndmanage.lib.data_types import FeePolicy
 from lndmanage.lib.user import yes_no_question
 from lndmanage.lib.forwardings import ForwardingAnalyzer
 from lndmanage import settings
@@ -32,35 +36,88 @@ optimization_parameters = {
     "n_t": 4 / 7,
 }
 
+# forwarding statistics of a channel without forwardings
+_EMPTY_STATS = {
+    "number_forwardings_out": 0,
+    "total_forwarding_out": 0,
+    "flow_direction": 0,
+    "fees_out": 0,
+    "total_forwarding_in": 0,
+    "number_forwardings": 0,
+}
 
-def delta_min(params: dict, local_balance: int, capacity: int):
-    """The capping from below for the delta_demand function."""
-    if not local_balance <= capacity:
+
+@dataclass(frozen=True)
+class OptimizationParameters:
+    """Fee optimization parameters, see optimization_parameters."""
+    cltv: int
+    min_base_fee: int
+    max_base_fee: int
+    min_fee_rate: float
+    max_fee_rate: float
+    delta_max: float
+    delta_min_up: float
+    delta_min_dn: float
+    r_t: float
+    local_balance_reserve: int
+    delta_b_min: float
+    delta_b_max: float
+    delta_b: float
+    n_t: float
+
+    @classmethod
+    def from_dict(cls, parameters: dict) -> "OptimizationParameters":
+        """Creates parameters from a dict, missing parameters are taken from
+        optimization_parameters, unknown keys are ignored."""
+        parameters = {**optimization_parameters, **parameters}
+        return cls(**{f.name: parameters[f.name] for f in fields(cls)})
+
+
+def delta_min_vec(
+    params: OptimizationParameters, local_balance: np.ndarray, capacity: np.ndarray
+) -> np.ndarray:
+    """The capping from below for the delta_demand function, evaluated for
+    arrays of local balances and capacities."""
+    local_balance = np.asarray(local_balance, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+
+    exceeding = local_balance > capacity
+    if exceeding.any():
+        i = np.argmax(exceeding)
         raise ValueError(
             f"local balance must be lower than capacity "
-            f"{local_balance} / {capacity}"
+            f"{local_balance[i]:.0f} / {capacity[i]:.0f}"
         )
 
     # if we have small channels, which can't respect the reserve, lower the
     # reserve
-    if params["local_balance_reserve"] > capacity // 2:
-        reserve = capacity // 3
-    else:
-        reserve = params["local_balance_reserve"]
-
-    # if local balance is below balance reserve, start to charge more fees
-    if local_balance < params["local_balance_reserve"]:
-        x = params["delta_min_up"] / reserve
-        return -x * (local_balance - reserve) + 1
+    reserve = np.where(
+        params.local_balance_reserve > capacity // 2,
+        capacity // 3,
+        params.local_balance_reserve,
+    )
 
+    # if local balance is below balance reserve, start to charge more fees,
     # if local balance is above balance reserve, charge less fees
-    else:
-        x = params["delta_min_dn"] / (capacity - reserve)
-        return -x * (local_balance - reserve) + 1
+    below_reserve = local_balance < params.local_balance_reserve
+    denominator = np.where(below_reserve, reserve, capacity - reserve)
+    if not denominator.all():
+        i = np.argmin(denominator != 0)
+        raise ZeroDivisionError(
+            f"no balance range to adjust fees in for local balance / capacity "
+            f"{local_balance[i]:.0f} / {capacity[i]:.0f}"
+        )
+    x = np.where(below_reserve, params.delta_min_up, params.delta_min_dn) / denominator
+    return -x * (local_balance - reserve) + 1
+
+
+def delta_min(params: OptimizationParameters, local_balance: int, capacity: int):
+    """The capping from below for the delta_demand function."""
+    return float(delta_min_vec(params, [local_balance], [capacity])[0])
 
 
 def delta_demand(
-    params: dict,
+    params: OptimizationParameters,
     time_interval: float,
     amount_out: float,
     local_balance: int,
@@ -76,51 +133,59 @@ def delta_demand(
     :param local_balance: local balance in sat
     :param capacity: capacity in sat
     :return: demand adjustment factor"""
-    r = amount_out / time_interval
-    r_t = params["r_t"]
-
-    logger.info(
-        f"    Outward forwarded amount: {amount_out:6.0f} "
-        f"(rate {r:5.0f} / target rate {r_t:5.0f})"
+    return float(
+        delta_demand_vec(
+            params, time_interval, [amount_out], [local_balance], [capacity]
+        )[0]
     )
 
-    m = params["delta_min_dn"]
 
-    c = 1.0 + m * (r / r_t - 1.0)
+def delta_demand_vec(
+    params: OptimizationParameters,
+    time_interval: float,
+    amount_out: np.ndarray,
+    local_balance: np.ndarray,
+    capacity: np.ndarray,
+) -> np.ndarray:
+    """Calculates the demand adjustment factors of delta_demand for arrays of
+    outward forwarded amounts, local balances and capacities."""
+    r = np.asarray(amount_out, dtype=float) / time_interval
+
+    m = params.delta_min_dn
+
+    c = 1.0 + m * (r / params.r_t - 1.0)
 
-    mc = delta_min(params, local_balance, capacity)
+    mc = delta_min_vec(params, local_balance, capacity)
 
-    # cap from below
-    if c < mc:
-        return mc
-    # cap from above
-    elif c > params["delta_max"]:
-        return params["delta_max"]
-    else:
-        return c
+    # cap from below, then from above
+    return np.where(c < mc, mc, np.minimum(c, params.delta_max))
 
 
 class FeeSetter(object):
     """Class for fee optimization."""
 
     def __init__(
-        self, node: "LndNode", from_days_ago=7, parameters: Optional[dict] = None
+        self,
+        node: "LndNode",
+        from_days_ago=7,
+        parameters: Optional[Union[dict, OptimizationParameters]] = None,
     ):
         """
         :param node: node instance
         :param from_days_ago: forwarding history is taken over the past
             from_days_ago days
-        :param parameters: fee algo parameters"""
+        :param parameters: fee algo parameters, a dict is completed by
+            optimization_parameters, which are the defaults"""
 
         # by default, channel fees are updated, not initialized
         self.node = node
 
         self.history_path = os.path.join(settings.home_dir, "fee_history.log")
 
-        if parameters is None:
-            self.params = optimization_parameters
-        else:
+        if isinstance(parameters, OptimizationParameters):
             self.params = parameters
+        else:
+            self.params = OptimizationParameters.from_dict(parameters or {})
 
         # initialize fee setter
         self.forwarding_analyzer = ForwardingAnalyzer(node)
@@ -141,6 +206,65 @@ class FeeSetter(object):
             self.forwarding_analyzer.get_forwarding_statistics_channels()
         )
 
+        # per-channel quantities are stored in arrays ordered by peer, such
+        # that they can be aggregated per peer in a single pass, the channel
+        # data, stats and fee policy of each peer's channels are kept as well
+        self.peer_channels = self.node.pubkey_to_channel_map(self.channels)
+        self.peer_index = np.repeat(
+            np.arange(len(self.peer_channels)),
+            [len(cs) for cs in self.peer_channels.values()],
+        )
+        capacities = []
+        local_balances = []
+        numbers_forwardings_out = []
+        totals_forwarding_out = []
+        fee_rates_ppm = []
+        base_fees = []
+        self.peer_channel_records = []
+        for cs in self.peer_channels.values():
+            channel_records = []
+            for channel_id in cs:
+                channel_data = self.channels[channel_id]
+                channel_stats = self.channels_forwarding_stats.get(
+                    channel_id, _EMPTY_STATS
+                )
+
+                numbers_forwardings_out.append(channel_stats["number_forwardings_out"])
+                totals_forwarding_out.append(channel_stats["total_forwarding_out"])
+                capacities.append(channel_data["capacity"])
+                local_balances.append(channel_data["local_balance"])
+
+                point = channel_data["channel_point"]
+                try:
+                    policy = self.channel_fee_policies[point]
+                except KeyError:
+                    raise Exception(
+                        f"Channel {channel_id} ({point}) not found in "
+                        "feereport. This is unexpected and may mean that this "
+                        "channel is not operating correctly."
+                    )
+
+                fee_rates_ppm.append(policy["fee_per_mil"])
+                base_fees.append(policy["base_fee_msat"])
+                channel_records.append(
+                    (channel_id, channel_data, channel_stats, policy)
+                )
+            self.peer_channel_records.append(channel_records)
+
+        self.capacities = np.array(capacities, dtype=float)
+        self.local_balances = np.array(local_balances, dtype=float)
+        self.numbers_forwardings_out = np.array(numbers_forwardings_out, dtype=float)
+        self.totals_forwarding_out = np.array(totals_forwarding_out, dtype=float)
+        self.fee_rates_ppm = np.array(fee_rates_ppm, dtype=float)
+        self.base_fees = np.array(base_fees, dtype=float)
+
+        # channels excluded from fee optimization via the config file
+        try:
+            ignored_channels = self.node.config.items("excluded-channels-fee-opt")
+            self.ignored_channels = {int(c) for c, _ in ignored_channels}
+        except NoSectionError:
+            self.ignored_channels = set()
+
     def set_fees(self, init=False, reckless=False) -> List[dict]:
         """Sets channel fee policies considering different metrics like
         unbalancedness and demand.
@@ -171,115 +295,122 @@ class FeeSetter(object):
 
         :param init: when true, fee policy is initialized
         :return: (new channel policies, fee update statistics)"""
+        params = self.params
+        time_interval_days = self.time_interval_days
+
         logger.info("Determining new channel policies based on demand.")
         logger.info(
             "Every channel will have a base fee of %d msat and cltv " "of %d.",
-            self.params["min_base_fee"],
-            self.params["cltv"],
+            params.min_base_fee,
+            params.cltv,
         )
         channel_fee_policies = {}
-
-        try:
-            ignored_channels = self.node.config.items("excluded-channels-fee-opt")
-            ignored_channels = {int(c) for c, _ in ignored_channels}
-        except NoSectionError:
-            ignored_channels = set()
-
         stats = []
 
-        # loop over channel peers
-        for pk, cs in self.node.pubkey_to_channel_map().items():
-            ignore_peer = bool(set(cs).intersection(ignored_channels))
-            logger.info(
-                f">>> Fee optimization for node {pk} "
-                f"({self.node.network.node_alias(pk)}):"
+        # aggregate channel information on a per peer basis
+        number_peers = len(self.peer_channels)
+
+        def peer_sum(values):
+            return np.bincount(self.peer_index, weights=values, minlength=number_peers)
+
+        peer_capacities = peer_sum(self.capacities)
+        peer_local_balances = peer_sum(self.local_balances)
+        peer_numbers_forwardings_out = peer_sum(self.numbers_forwardings_out)
+        peer_totals_forwarding_out = peer_sum(self.totals_forwarding_out)
+        # calculate average base fee and fee rate
+        peer_numbers_channels = np.bincount(self.peer_index, minlength=number_peers)
+        peer_base_fees_msat = peer_sum(self.base_fees) / peer_numbers_channels
+        peer_fee_rates_ppm = peer_sum(self.fee_rates_ppm) / peer_numbers_channels
+
+        # fee rates are set in integer parts per million
+        min_fee_rate_ppm = round(params.min_fee_rate * 1E6)
+        max_fee_rate_ppm = round(params.max_fee_rate * 1E6)
+
+        # FEE RATES
+        # if we initialize the fee optimization, we want to start with
+        # reasonable starting values
+        if init:
+            peer_fee_rates_new_ppm = np.full(number_peers, max_fee_rate_ppm // 2)
+        else:
+            peer_factors_demand = delta_demand_vec(
+                params,
+                time_interval_days,
+                peer_totals_forwarding_out,
+                peer_local_balances,
+                peer_capacities,
+            )
+            peer_fee_rates_new_ppm = np.floor(
+                peer_fee_rates_ppm * peer_factors_demand + 0.5
+            )
+            # if the fee rate is too low, cap it, but we don't want to lose
+            # channels from appearing greedy
+            peer_fee_rates_new_ppm = np.clip(
+                peer_fee_rates_new_ppm, min_fee_rate_ppm, max_fee_rate_ppm
             )
-            # loop over channels with peer
-            peer_capacity = 0
-            peer_local_balance = 0
-            peer_number_forwardings_out = 0
-            peer_total_forwarding_out = 0
-            cumul_base_fee = 0
-            cumul_fee_rate = 0
-
-            # accumulate information on a per peer basis
-            for channel_id in cs:
-                # collect channel info and stats
-                channel_data = self.channels[channel_id]
-                channel_stats = self.channels_forwarding_stats.get(channel_id, None)
-
-                if channel_stats is None:
-                    number_forwardings_out = 0
-                    total_forwarding_out = 0
-                else:
-                    number_forwardings_out = channel_stats["number_forwardings_out"]
-                    total_forwarding_out = channel_stats["total_forwarding_out"]
 
-                peer_capacity += channel_data["capacity"]
-                peer_local_balance += channel_data["local_balance"]
-                peer_number_forwardings_out += number_forwardings_out
-                peer_total_forwarding_out += total_forwarding_out
+        # BASE FEES
+        if init:
+            peer_base_fees_msat_new = np.full(number_peers, params.min_base_fee)
+        else:
+            peer_factors_base_fee = self.factor_demand_base_fee(
+                peer_numbers_forwardings_out
+            )
+            # limit from below and above, base fees are whole msats
+            peer_base_fees_msat_new = np.trunc(np.clip(
+                np.trunc(peer_base_fees_msat) * peer_factors_base_fee,
+                params.min_base_fee,
+                params.max_base_fee,
+            ))
 
-                point = channel_data["channel_point"]
-                try:
-                    policy = self.channel_fee_policies[point]
-                except KeyError:
-                    raise Exception(
-                        f"Channel {channel_id} ({point}) not found in "
-                        "feereport. This is unexpected and may mean that this "
-                        "channel is not operating correctly."
-                    )
+        node_alias = self.node.network.node_alias
 
-                cumul_fee_rate += policy["fee_rate"]
-                cumul_base_fee += policy["base_fee_msat"]
+        # loop over channel peers
+        for i, (pk, cs) in enumerate(self.peer_channels.items()):
+            ignore_peer = bool(self.ignored_channels.intersection(cs))
+            # the alias is only needed for the log
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    ">>> Fee optimization for node %s (%s):", pk, node_alias(pk)
+                )
+            peer_capacity = int(peer_capacities[i])
+            peer_local_balance = int(peer_local_balances[i])
+            peer_number_forwardings_out = int(peer_numbers_forwardings_out[i])
+            peer_total_forwarding_out = int(peer_totals_forwarding_out[i])
 
             logger.info(
-                f"    Channels with peer: {len(cs)}, "
-                f"total capacity: {peer_capacity}, "
-                f"total local balance: {peer_local_balance}"
+                "    Channels with peer: %d, total capacity: %d, "
+                "total local balance: %d",
+                len(cs),
+                peer_capacity,
+                peer_local_balance,
             )
 
-            # calculate average base fee and fee rate
-            base_fee_msat = int(cumul_base_fee / len(cs))
-            fee_rate = cumul_fee_rate / len(cs)
-
-            # FEE RATES
-            # if we initialize the fee optimization, we want to start with
-            # reasonable starting values
-            if init:
-                fee_rate_new = self.params["max_fee_rate"] / 2
-            else:
-                factor_demand = delta_demand(
-                    self.params,
-                    self.time_interval_days,
+            base_fee_msat = int(peer_base_fees_msat[i])
+            fee_rate_ppm = float(peer_fee_rates_ppm[i])
+
+            if not init:
+                logger.info(
+                    "    Outward forwarded amount: %6.0f "
+                    "(rate %5.0f / target rate %5.0f)",
                     peer_total_forwarding_out,
-                    peer_local_balance,
-                    peer_capacity,
+                    peer_total_forwarding_out / time_interval_days,
+                    params.r_t,
                 )
-                fee_rate_new = fee_rate * factor_demand
-                # if the fee rate is too low, cap it
-                fee_rate_new = max(self.params["min_fee_rate"], fee_rate_new)
-                # we don't want to lose channels from appearing greedy
-                fee_rate_new = min(self.params["max_fee_rate"], fee_rate_new)
-            # API expects 6 digits format
-            fee_rate_new = round(fee_rate_new, 6)
-            factor_demand = fee_rate_new / fee_rate if fee_rate else float("inf")
-
-            # BASE FEES
-            if init:
-                base_fee_msat_new = self.params["min_base_fee"]
-            else:
-                factor_base_fee = self.factor_demand_base_fee(peer_number_forwardings_out)
-                base_fee_msat_new = base_fee_msat * factor_base_fee
-                # limit from below
-                base_fee_msat_new = int(
-                    max(self.params["min_base_fee"], base_fee_msat_new)
-                )
-                # limit from above
-                base_fee_msat_new = int(
-                    min(self.params["max_base_fee"], base_fee_msat_new)
+                logger.info(
+                    "    Number of outward forwardings: %6.0f",
+                    peer_number_forwardings_out,
                 )
-            factor_base_fee = base_fee_msat_new / base_fee_msat if base_fee_msat else float("inf")
+            fee_rate_new_ppm = int(peer_fee_rates_new_ppm[i])
+            factor_demand = (
+                fee_rate_new_ppm / fee_rate_ppm if fee_rate_ppm else float("inf")
+            )
+            fee_rate = fee_rate_ppm / 1E6
+            fee_rate_new = fee_rate_new_ppm / 1E6
+
+            base_fee_msat_new = int(peer_base_fees_msat_new[i])
+            factor_base_fee = (
+                base_fee_msat_new / base_fee_msat if base_fee_msat else float("inf")
+            )
 
             logger.info(
                 "    Fee rate change: %1.6f -> %1.6f (factor %1.3f)",
@@ -296,42 +427,35 @@ class FeeSetter(object):
             )
 
             # second loop through channels
-            for channel_id in cs:
-                channel_data = self.channels[channel_id]
-                channel_stats = self.channels_forwarding_stats.get(channel_id, None)
-                if channel_stats is None:
-                    flow = 0
-                    fees_sat = 0
-                    total_forwarding_in = 0
-                    total_forwarding_out = 0
-                    number_forwardings = 0
-                    number_forwardings_out = 0
-                else:
-                    flow = channel_stats["flow_direction"]
-                    fees_sat = channel_stats["fees_out"] / 1000
-                    total_forwarding_in = channel_stats["total_forwarding_in"]
-                    total_forwarding_out = channel_stats["total_forwarding_out"]
-                    number_forwardings = channel_stats["number_forwardings"]
-                    number_forwardings_out = channel_stats["number_forwardings_out"]
+            for channel_id, channel_data, channel_stats, policy in (
+                self.peer_channel_records[i]
+            ):
+                flow = channel_stats["flow_direction"]
+                fees_sat = channel_stats["fees_out"] / 1000
+                total_forwarding_in = channel_stats["total_forwarding_in"]
+                total_forwarding_out = channel_stats["total_forwarding_out"]
+                number_forwardings = channel_stats["number_forwardings"]
+                number_forwardings_out = channel_stats["number_forwardings_out"]
 
                 lb = channel_data["local_balance"]
                 ub = channel_data["unbalancedness"]
                 capacity = channel_data["capacity"]
 
-                logger.info("  > Statistics for channel %s:", channel_id)
-                logger.info(
-                    "    ub: %0.2f, flow: %0.2f, fees: %1.3f sat, "
-                    "cap: %d sat, lb: %d sat, nfwd: %d, in: %d sat, "
-                    "out: %d sat.",
-                    ub,
-                    flow,
-                    fees_sat,
-                    capacity,
-                    lb,
-                    number_forwardings,
-                    total_forwarding_in,
-                    total_forwarding_out,
-                )
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("  > Statistics for channel %s:", channel_id)
+                    logger.info(
+                        "    ub: %0.2f, flow: %0.2f, fees: %1.3f sat, "
+                        "cap: %d sat, lb: %d sat, nfwd: %d, in: %d sat, "
+                        "out: %d sat.",
+                        ub,
+                        flow,
+                        fees_sat,
+                        capacity,
+                        lb,
+                        number_forwardings,
+                        total_forwarding_in,
+                        total_forwarding_out,
+                    )
 
                 stats.append(
                     {
@@ -345,59 +469,50 @@ class FeeSetter(object):
                         "fees": fees_sat,
                         "cap": capacity,
                         "fdem": factor_demand,
-                        "fr": self.channel_fee_policies[channel_data["channel_point"]][
-                            "fee_rate"
-                        ],
+                        "fr": policy["fee_rate"],
                         "frn": fee_rate_new,
                         "nfwd": number_forwardings,
                         "nfwdo": number_forwardings_out,
                         "fbase": factor_base_fee,
-                        "bf": self.channel_fee_policies[channel_data["channel_point"]][
-                            "base_fee_msat"
-                        ],
+                        "bf": policy["base_fee_msat"],
                         "bfn": base_fee_msat_new,
                     }
                 )
 
                 if ignore_peer:
-                    logger.info(f"    Ignore channel {channel_id} due to config file.")
+                    logger.info("    Ignore channel %s due to config file.", channel_id)
                 else:
-                    channel_fee_policies[channel_data["channel_point"]] = {
-                        "base_fee_msat": base_fee_msat_new,
-                        "fee_rate": fee_rate_new,
-                        "cltv": self.params["cltv"],
-                    }
+                    channel_fee_policies[channel_data["channel_point"]] = FeePolicy(
+                        base_fee_msat_new, fee_rate_new_ppm, params.cltv
+                    )
             logger.info("")
         return channel_fee_policies, stats
 
-    def factor_demand_base_fee(self, num_fwd_out: int) -> float:
-        """Calculates a change factor by taking into account the number of
+    def factor_demand_base_fee(self, num_fwd_out: np.ndarray) -> np.ndarray:
+        """Calculates change factors by taking into account the number of
         transactions transacted in a time interval compared to a fixed number
         of transactions.
 
-        :param num_fwd_out: number of outward forwardings
+        :param num_fwd_out: numbers of outward forwardings per peer
         :return: [1-c_max, 1+c_max]"""
-        logger.info("    Number of outward forwardings: %6.0f", num_fwd_out)
-
+        params = self.params
         n = num_fwd_out / self.time_interval_days
-        delta = 1 + optimization_parameters["delta_b"] * (
-            n / optimization_parameters["n_t"] - 1
-        )
+        delta = 1 + params.delta_b * (n / params.n_t - 1)
 
-        delta = max(
-            1 - optimization_parameters["delta_b_min"],
-            min(delta, 1 + optimization_parameters["delta_b_max"]),
+        return np.maximum(
+            1 - params.delta_b_min,
+            np.minimum(delta, 1 + params.delta_b_max),
         )
-        return delta
 
     def append_to_history(self, stats: List[dict]):
         """append_history adds the fee setting statistics to a pickle file.
 
         :param stats: fee statistics"""
         logger.debug("Saving fee setting stats to fee history.")
+        # one line per fee update, written at once
+        line = json.dumps(stats) + "\n"
         with open(self.history_path, "a") as f:
-            json.dump(stats, f)
-            f.write("\n")
+            f.write(line)
 
     def read_history(self) -> List[dict]:
         """read_history is a function for unpickling the fee setting history.
@@ -405,10 +520,7 @@ class FeeSetter(object):
         :return: list of fee setting statistics
         :rtype: list[dict]"""
         with open(self.history_path, "r") as f:
-            history = []
-            for i, line in enumerate(f):
-                history.append(json.loads(line))
-        return history
+            return [json.loads(line) for line in f]
 
 
 if __name__ == "__main__":
@@ -1,13 +1,15 @@
 """Module for gathering statistics of channels or nodes."""
 from collections import OrderedDict, defaultdict
+from functools import cached_property
 import logging
-from typing import Dict
+from statistics import median
+from typing import Dict, List
 
 import numpy as np
 
 from lndmanage.lib.data_types import NodeProperties
-from lndmanage.lib.node import LndNode
 from lndmanage.lib.ln_utilities import local_balance_to_unbalancedness
+from lndmanage.lib.node import LndNode
 from lndmanage import settings
 
 logger = logging.getLogger(__name__)
@@ -19,11 +21,95 @@ NEIGHBOR_WEIGHT = 0.1
 NEXT_NEIGHBOR_WEIGHT = 0.02
 
 
-def nan_to_zero(number: float) -> float:
-    if number is np.nan or number != number:
-        return 0.0
-    else:
-        return number
+def _column(events: List[dict], key: str, dtype) -> np.ndarray:
+    """Extracts a field of all forwarding events as an array."""
+    return np.fromiter((e[key] for e in events), dtype=dtype, count=len(events))
+
+
+def _split_by_index(
+    indices: np.ndarray, number_groups: int, *columns: np.ndarray
+) -> List[List[np.ndarray]]:
+    """Splits each column into number_groups arrays by the group indices of
+    its rows, keeping the order of rows within a group."""
+    if not number_groups:
+        return [[] for _ in columns]
+    order = np.argsort(indices, kind="stable")
+    boundaries = np.cumsum(np.bincount(indices, minlength=number_groups))[:-1]
+    return [np.split(column[order], boundaries) for column in columns]
+
+
+def _group_forwardings(
+    number_groups: int,
+    indices_in: np.ndarray,
+    indices_out: np.ndarray,
+    amounts_in: np.ndarray,
+    amounts_out: np.ndarray,
+    fees_in: np.ndarray,
+    fees_out: np.ndarray,
+    timestamps: np.ndarray,
+) -> List["ForwardingStatistics"]:
+    """Groups inward and outward forwardings by their group (channel or node)
+    indices into statistics objects."""
+    inward = zip(*_split_by_index(indices_in, number_groups, amounts_in, fees_in))
+    outward = zip(
+        *_split_by_index(
+            indices_out, number_groups, amounts_out, fees_out, timestamps
+        )
+    )
+    return [
+        ForwardingStatistics.from_arrays(
+            amounts_in, amounts_out, timestamps, fees_in, fees_out
+        )
+        for (amounts_in, fees_in), (amounts_out, fees_out, timestamps) in zip(
+            inward, outward
+        )
+    ]
+
+
+def _group_medians(
+    indices: np.ndarray, values: np.ndarray, number_groups: int
+) -> np.ndarray:
+    """Calculates the medians of the values of each group at once. The values
+    are sorted by group and value, such that the medians are the middle
+    elements of the groups' segments. Groups without values have median 0."""
+    sorted_values = values[np.lexsort((values, indices))].astype(float)
+    numbers = np.bincount(indices, minlength=number_groups)
+    starts = np.cumsum(numbers) - numbers
+    has_values = numbers > 0
+    lower = (starts + (numbers - 1) // 2)[has_values]
+    upper = (starts + numbers // 2)[has_values]
+    medians = np.zeros(number_groups)
+    medians[has_values] = (sorted_values[lower] + sorted_values[upper]) / 2
+    return medians
+
+
+def _align_weights(first_neighbors, second_neighbors):
+    """Aligns two sets of node weights on the union of their node indices.
+
+    :param first_neighbors: (np.ndarray, np.ndarray), node indices sorted
+                            ascendingly and node weights
+    :param second_neighbors: (np.ndarray, np.ndarray), node indices sorted
+                             ascendingly and node weights
+    :return: union of node indices, first and second weights (zero for
+             missing nodes), masks of nodes in the first and second set
+    """
+    first_indices, first_weights = first_neighbors
+    second_indices, second_weights = second_neighbors
+
+    indices = np.union1d(first_indices, second_indices)
+    first_positions = np.searchsorted(indices, first_indices)
+    second_positions = np.searchsorted(indices, second_indices)
+
+    first = np.zeros(indices.size)
+    first[first_positions] = first_weights
+    second = np.zeros(indices.size)
+    second[second_positions] = second_weights
+    in_first = np.zeros(indices.size, dtype=bool)
+    in_first[first_positions] = True
+    in_second = np.zeros(indices.size, dtype=bool)
+    in_second[second_positions] = True
+
+    return indices, first, second, in_first, in_second
 
 
 class ForwardingAnalyzer(object):
@@ -32,9 +118,26 @@ class ForwardingAnalyzer(object):
     def __init__(self, node: "LndNode"):
         self.node = node
         self.forwarding_events = self.node.get_forwarding_events()
-        self.channel_forwarding_stats = {}  # type: Dict[str, ForwardingStatistics]
+        # the fields of the forwarding events as columns
+        events = self.forwarding_events
+        self._event_timestamps = _column(events, "timestamp", np.int64)
+        self._event_channel_ids_in = _column(events, "chan_id_in", np.uint64)
+        self._event_channel_ids_out = _column(events, "chan_id_out", np.uint64)
+        self._event_amounts_in = _column(events, "amt_in", np.int64)
+        self._event_amounts_out = _column(events, "amt_out", np.int64)
+        self._event_amounts_out_msat = _column(events, "amt_out_msat", np.int64)
+        self._event_fees = _column(events, "fee_msat", np.int64)
         self.node_forwarding_stats = {}  # type: Dict[str, ForwardingStatistics]
         self.max_time_interval_days = None
+        # channels with forwardings in the analyzed time interval in the order
+        # of their first appearance
+        self._channel_ids = []  # type: List[int]
+        # forwardings in the analyzed time interval, with the indices of their
+        # inward and outward channels in _channel_ids
+        self._channel_indices = np.empty((0, 2), dtype=np.int64)
+        self._amounts_in = np.empty(0, dtype=np.int64)
+        self._amounts_out = np.empty(0, dtype=np.int64)
+        self._fees = np.empty(0, dtype=np.int64)
 
     def initialize_forwarding_stats(self, time_start: float, time_end: float):
         """Initializes the channel and node statistics objects with data from forwardings.
@@ -43,90 +146,145 @@ class ForwardingAnalyzer(object):
         :param time_end: time interval end, unix timestamp
         """
         channel_id_to_node_id = self.node.channel_id_to_node_id()
-        self.channel_forwarding_stats = defaultdict(ForwardingStatistics)
-        self.node_forwarding_stats = defaultdict(ForwardingStatistics)
-
-        min_timestamp = float("inf")
-        max_timestamp = 0
-        for f in self.forwarding_events:
-            if time_start < f["timestamp"] < time_end:
-                # find min and max range of forardings
-                if f["timestamp"] > max_timestamp:
-                    max_timestamp = f["timestamp"]
-                if f["timestamp"] < min_timestamp:
-                    min_timestamp = f["timestamp"]
-                # make a dictionary entry for unknown channels
-                channel_id_in = f["chan_id_in"]
-                channel_id_out = f["chan_id_out"]
-                node_id_in = channel_id_to_node_id.get(channel_id_in)
-                node_id_out = channel_id_to_node_id.get(channel_id_out)
-
-                # node statistics
-                if node_id_in:
-                    self.node_forwarding_stats[node_id_in].inward_forwardings.append(
-                        f["amt_in"]
-                    )
-                    self.node_forwarding_stats[node_id_in].fees_in.append(
-                        f["fee_msat"]
-                    )
-                if node_id_out:
-                    self.node_forwarding_stats[node_id_out].outward_forwardings.append(
-                        f["amt_out"]
-                    )
-                    self.node_forwarding_stats[node_id_out].fees_out.append(
-                        f["fee_msat"]
-                    )
-                    self.node_forwarding_stats[node_id_out].timestamps.append(
-                        f["timestamp"]
-                    )
 
-                # channel statistics
-                # inward channel:
-                self.channel_forwarding_stats[channel_id_in].inward_forwardings.append(
-                    f["amt_in"]
-                )
-                self.channel_forwarding_stats[channel_id_in].fees_in.append(
-                    f["fee_msat"]
-                )
-                # outward channel:
-                self.channel_forwarding_stats[
-                    channel_id_out
-                ].outward_forwardings.append(f["amt_out"])
-                self.channel_forwarding_stats[channel_id_out].fees_out.append(
-                    f["fee_msat"]
-                )
-                self.channel_forwarding_stats[channel_id_out].timestamps.append(
-                    f["timestamp"]
+        # select the forwardings in the time interval
+        in_interval = (time_start < self._event_timestamps) & (
+            self._event_timestamps < time_end
+        )
+        timestamps = self._event_timestamps[in_interval]
+        channel_ids_in = self._event_channel_ids_in[in_interval]
+        channel_ids_out = self._event_channel_ids_out[in_interval]
+        amounts_in = self._event_amounts_in[in_interval]
+        amounts_out = self._event_amounts_out[in_interval]
+        fees = self._event_fees[in_interval]
+
+        # enumerate channels in the order of their first appearance, the
+        # inward channel of a forwarding coming before the outward channel
+        channel_ids, first_appearances, channel_indices = np.unique(
+            np.column_stack((channel_ids_in, channel_ids_out)).ravel(),
+            return_index=True,
+            return_inverse=True,
+        )
+        order = np.argsort(first_appearances)
+        ranks = np.empty_like(order)
+        ranks[order] = np.arange(len(order))
+        channel_ids = channel_ids[order].tolist()
+        channel_indices = ranks[channel_indices.ravel()].reshape(-1, 2)
+
+        # enumerate nodes in the same way, forwardings over channels with
+        # unknown nodes don't contribute to node statistics
+        node_indices_by_node_id = {}
+        node_indices_by_channel = np.full(len(channel_ids), -1)
+        for channel_index, channel_id in enumerate(channel_ids):
+            node_id = channel_id_to_node_id.get(channel_id)
+            if node_id:
+                node_indices_by_channel[channel_index] = (
+                    node_indices_by_node_id.setdefault(
+                        node_id, len(node_indices_by_node_id)
+                    )
                 )
+        node_indices = node_indices_by_channel[channel_indices]
+
+        self._channel_ids = channel_ids
+        self._channel_indices = channel_indices
+        self._amounts_in = amounts_in
+        self._amounts_out = amounts_out
+        self._fees = fees
+        known_in = node_indices[:, 0] >= 0
+        known_out = node_indices[:, 1] >= 0
+
+        self.node_forwarding_stats = dict(
+            zip(
+                node_indices_by_node_id,
+                _group_forwardings(
+                    len(node_indices_by_node_id),
+                    node_indices[known_in, 0],
+                    node_indices[known_out, 1],
+                    amounts_in[known_in],
+                    amounts_out[known_out],
+                    fees[known_in],
+                    fees[known_out],
+                    timestamps[known_out],
+                ),
+            )
+        )
 
         # determine the time interval starting with the first forwarding
         # to the last forwarding in the analyzed time interval determined
-        # by time_start and time_end
-        self.max_time_interval_days = (max_timestamp - min_timestamp) / (24 * 60 * 60)
+        # by time_start and time_end, without forwardings there is no interval
+        if timestamps.size:
+            self.max_time_interval_days = int(
+                timestamps.max() - timestamps.min()
+            ) / (24 * 60 * 60)
+        else:
+            self.max_time_interval_days = 0.0
 
     def get_forwarding_statistics_channels(self):
         """Prepares the forwarding statistics for each channel.
 
         :return: dict: statistics with channel_id as keys
         """
-        channel_statistics = {}
+        number_channels = len(self._channel_ids)
+        indices_in = self._channel_indices[:, 0]
+        indices_out = self._channel_indices[:, 1]
+
+        # sums and maxima are reduced over all channels at once, amounts
+        # are far below 2^53, such that the float sums are exact
+        def channel_sums(indices, values):
+            return np.bincount(
+                indices, weights=values, minlength=number_channels
+            ).astype(np.int64).tolist()
+
+        def channel_maxima(indices, values):
+            maxima = np.full(number_channels, -1, dtype=np.int64)
+            np.maximum.at(maxima, indices, values)
+            return maxima.tolist()
+
+        numbers_in = np.bincount(indices_in, minlength=number_channels).tolist()
+        numbers_out = np.bincount(indices_out, minlength=number_channels).tolist()
+        medians_in = _group_medians(
+            indices_in, self._amounts_in, number_channels
+        ).tolist()
+        medians_out = _group_medians(
+            indices_out, self._amounts_out, number_channels
+        ).tolist()
+        totals_in = channel_sums(indices_in, self._amounts_in)
+        totals_out = channel_sums(indices_out, self._amounts_out)
+        fees_in = channel_sums(indices_in, self._fees)
+        fees_out = channel_sums(indices_out, self._fees)
+        largest_in = channel_maxima(indices_in, self._amounts_in)
+        largest_out = channel_maxima(indices_out, self._amounts_out)
 
-        for k, c in self.channel_forwarding_stats.items():
+        channel_statistics = {}
+        for i, k in enumerate(self._channel_ids):
+            total_in = totals_in[i]
+            total_out = totals_out[i]
+            number_in = numbers_in[i]
+            number_out = numbers_out[i]
             channel_statistics[k] = {
-                "fees_out": c.total_fees_out(),
-                "fees_in": c.total_fees_in(),
-                "fees_in_out": c.total_fees_in() + c.total_fees_out(),
-                "flow_direction": c.flow_direction(),
-                "mean_forwarding_in": c.mean_forwarding_in(),
-                "mean_forwarding_out": c.mean_forwarding_out(),
-                "median_forwarding_in": c.median_forwarding_in(),
-                "median_forwarding_out": c.median_forwarding_out(),
-                "number_forwardings": c.number_forwardings(),
-                "number_forwardings_out": c.number_forwardings_out(),
-                "largest_forwarding_amount_in": c.largest_forwarding_amount_in(),
-                "largest_forwarding_amount_out": c.largest_forwarding_amount_out(),
-                "total_forwarding_in": c.total_forwarding_in(),
-                "total_forwarding_out": c.total_forwarding_out(),
+                "fees_out": fees_out[i],
+                "fees_in": fees_in[i],
+                "fees_in_out": fees_in[i] + fees_out[i],
+                "flow_direction": (
+                    (-total_in + total_out) / (total_in + total_out)
+                    if total_in + total_out else 0
+                ),
+                "mean_forwarding_in": total_in / number_in if number_in else 0.0,
+                "mean_forwarding_out": (
+                    total_out / number_out if number_out else 0.0
+                ),
+                "median_forwarding_in": medians_in[i],
+                "median_forwarding_out": medians_out[i],
+                "number_forwardings": number_in + number_out,
+                "number_forwardings_out": number_out,
+                "largest_forwarding_amount_in": (
+                    largest_in[i] if number_in else float("nan")
+                ),
+                "largest_forwarding_amount_out": (
+                    largest_out[i] if number_out else float("nan")
+                ),
+                "total_forwarding_in": total_in,
+                "total_forwarding_out": total_out,
             }
         return channel_statistics
 
@@ -147,35 +305,35 @@ class ForwardingAnalyzer(object):
 
         forwarding_stats = defaultdict(dict)
         for nid, node_stats in self.node_forwarding_stats.items():
-            tot_in = node_stats.total_forwarding_in()
-            tot_out = node_stats.total_forwarding_out()
-            forwarding_stats[nid]["fees_out"] = node_stats.total_fees_out()
-            forwarding_stats[nid]["fees_in"] = node_stats.total_fees_in()
-            forwarding_stats[nid]["fees_in_out"] = node_stats.total_fees_in() + node_stats.total_fees_out()
+            tot_in = node_stats.total_forwarding_in
+            tot_out = node_stats.total_forwarding_out
+            forwarding_stats[nid]["fees_out"] = node_stats.total_fees_out
+            forwarding_stats[nid]["fees_in"] = node_stats.total_fees_in
+            forwarding_stats[nid]["fees_in_out"] = node_stats.total_fees_in + node_stats.total_fees_out
             forwarding_stats[nid]["flow_direction"] = (
                 -((float(tot_in) / (tot_in + tot_out)) - 0.5) / 0.5
             )
             forwarding_stats[nid][
                 "largest_forwarding_amount_in"
-            ] = node_stats.largest_forwarding_amount_in()
+            ] = node_stats.largest_forwarding_amount_in
             forwarding_stats[nid][
                 "largest_forwarding_amount_out"
-            ] = node_stats.largest_forwarding_amount_out()
+            ] = node_stats.largest_forwarding_amount_out
             forwarding_stats[nid][
                 "mean_forwarding_in"
-            ] = node_stats.mean_forwarding_in()
+            ] = node_stats.mean_forwarding_in
             forwarding_stats[nid][
                 "mean_forwarding_out"
-            ] = node_stats.mean_forwarding_out()
+            ] = node_stats.mean_forwarding_out
             forwarding_stats[nid][
                 "median_forwarding_in"
-            ] = node_stats.median_forwarding_in()
+            ] = node_stats.median_forwarding_in
             forwarding_stats[nid][
                 "median_forwarding_out"
-            ] = node_stats.median_forwarding_out()
+            ] = node_stats.median_forwarding_out
             forwarding_stats[nid][
                 "number_forwardings"
-            ] = node_stats.number_forwardings()
+            ] = node_stats.number_forwardings
             forwarding_stats[nid]["total_forwarding_in"] = tot_in
             forwarding_stats[nid]["total_forwarding_out"] = tot_out
             forwarding_stats[nid]["total_forwarding"] = tot_in + tot_out
@@ -212,9 +370,12 @@ class ForwardingAnalyzer(object):
 
         logger.info("Doing simple forwarding analysis.")
 
-        # initialize node score dictionaries
-        total_incoming_neighbors = defaultdict(float)
-        total_outgoing_neighbors = defaultdict(float)
+        # nodes are enumerated, such that their scores can be accumulated
+        # in arrays
+        nodes = list(self.node.network.graph.nodes)
+        node_indices = {n: i for i, n in enumerate(nodes)}
+        total_incoming_neighbors = np.zeros(len(nodes))
+        total_outgoing_neighbors = np.zeros(len(nodes))
 
         logger.info(
             f"Total forwarding events found: " f"{len(self.forwarding_events)}."
@@ -225,8 +386,62 @@ class ForwardingAnalyzer(object):
         )
         number_progress_report = last_forwardings_to_analyze // 10
 
+        # the same nodes take part in many forwardings, their neighbor
+        # weights are therefore determined once, as node indices sorted
+        # ascendingly and weights, excluded nodes don't influence the weights
+        # of the other nodes and are filtered later
+        joined_neighbors_cache = {}
+
+        def joined_neighbors(node_pub_key, excluded_nodes):
+            try:
+                indices, weights = joined_neighbors_cache[node_pub_key]
+            except KeyError:
+                indices, weights = self.__determine_joined_neighbors(
+                    node_pub_key, node_indices
+                )
+                joined_neighbors_cache[node_pub_key] = indices, weights
+            keep = ~np.isin(
+                indices, [node_indices.get(n, -1) for n in excluded_nodes]
+            )
+            return indices[keep], weights[keep]
+
+        channel_ids_in = self._event_channel_ids_in[
+            -last_forwardings_to_analyze:
+        ].tolist()
+        channel_ids_out = self._event_channel_ids_out[
+            -last_forwardings_to_analyze:
+        ].tolist()
+        amounts_out_msat = self._event_amounts_out_msat[
+            -last_forwardings_to_analyze:
+        ]
+        # If we know, that the outward hop already reached the
+        # target of the payment, we don't want to add the neighbors
+        # of the outgoing node to the total statistics.
+        # We know if the next hop was the final one of the payment by
+        # testing whether the forwarding amount in msat has remainder
+        # zero when divided by 1000 or not, provided the sent amount
+        # was larger than 1E6 msat.
+        not_last_hop = (amounts_out_msat % 1000 != 0).tolist()
+        amounts_out_msat = amounts_out_msat.tolist()
+
+        # the remote node of each channel involved in the analyzed forwardings
+        # is looked up once, channels unknown to the graph are skipped
+        own_pub_key = self.node.pub_key
+        edges = self.node.network.edges
+        other_ends = {}
+        for chan_id in set(channel_ids_in).union(channel_ids_out):
+            edge_data = edges.get(chan_id)
+            if edge_data is not None:
+                other_ends[chan_id] = (
+                    edge_data["node1_pub"]
+                    if edge_data["node1_pub"] != own_pub_key
+                    else edge_data["node2_pub"]
+                )
+
         meaningful_outward_forwardings = 0
-        for nf, f in enumerate(self.forwarding_events[-last_forwardings_to_analyze:]):
+        for nf, (chan_id_in, chan_id_out) in enumerate(
+            zip(channel_ids_in, channel_ids_out)
+        ):
 
             # report progress
             if nf % number_progress_report == 0:
@@ -235,82 +450,68 @@ class ForwardingAnalyzer(object):
                     f"{100 * float(nf) / last_forwardings_to_analyze}%"
                 )
 
-            chan_id_in = f["chan_id_in"]
-            chan_id_out = f["chan_id_out"]
+            # determine incoming and outgoing node pub keys
+            incoming_node_pub_key = other_ends.get(chan_id_in)
+            outgoing_node_pub_key = other_ends.get(chan_id_out)
+            if incoming_node_pub_key is None or outgoing_node_pub_key is None:
+                continue
+
+            # nodes involved in the forwarding process should be excluded
+            excluded_nodes = [
+                own_pub_key,
+                incoming_node_pub_key,
+                outgoing_node_pub_key,
+            ]
+
+            # determine all the nearest and second nearest
+            # neighbors of the incoming/outgoing nodes,
+            # they may appear more than once
+            incoming_neighbors = joined_neighbors(
+                incoming_node_pub_key, excluded_nodes
+            )
+            outgoing_neighbors = joined_neighbors(
+                outgoing_node_pub_key, excluded_nodes
+            )
 
-            edge_data_in = self.node.network.edges.get(chan_id_in, None)
-            edge_data_out = self.node.network.edges.get(chan_id_out, None)
+            # do a symmetric difference of node sets with weights
+            symmetric_difference_weights = self.__symmetric_difference(
+                incoming_neighbors, outgoing_neighbors
+            )
 
-            if edge_data_in is not None and edge_data_out is not None:
-                # determine incoming and outgoing node pub keys
-                incoming_node_pub_key = (
-                    edge_data_in["node1_pub"]
-                    if edge_data_in["node1_pub"] != self.node.pub_key
-                    else edge_data_in["node2_pub"]
-                )
-                outgoing_node_pub_key = (
-                    edge_data_out["node1_pub"]
-                    if edge_data_out["node1_pub"] != self.node.pub_key
-                    else edge_data_out["node2_pub"]
-                )
+            final_outgoing_nodes = self.__filter_nodes(
+                symmetric_difference_weights, return_positive_weights=True
+            )
+            final_incoming_nodes = self.__filter_nodes(
+                symmetric_difference_weights, return_positive_weights=False
+            )
 
-                # nodes involved in the forwarding process should be excluded
-                excluded_nodes = [
-                    self.node.pub_key,
-                    incoming_node_pub_key,
-                    outgoing_node_pub_key,
-                ]
-
-                # determine all the nearest and second nearest
-                # neighbors of the incoming/outgoing nodes,
-                # they may appear more than once
-                incoming_neighbors = self.__determine_joined_neighbors(
-                    incoming_node_pub_key, excluded_nodes=excluded_nodes
-                )
-                outgoing_neighbors = self.__determine_joined_neighbors(
-                    outgoing_node_pub_key, excluded_nodes=excluded_nodes
-                )
+            # normalize the weights
+            incoming_indices, normalized_incoming = self.__normalize_neighbors(
+                final_incoming_nodes
+            )
+            outgoing_indices, normalized_outgoing = self.__normalize_neighbors(
+                final_outgoing_nodes
+            )
 
-                # do a symmetric difference of node sets with weights
-                symmetric_difference_weights = self.__symmetric_difference(
-                    incoming_neighbors, outgoing_neighbors
-                )
+            # set weight for each forwarding event
+            weight = 1
+            # alternatively, the inward amount or fee of the forwarding:
+            # weight = self._event_amounts_in[-last_forwardings_to_analyze:][nf]
+            # weight = self._event_fees[-last_forwardings_to_analyze:][nf]
+
+            total_incoming_neighbors[incoming_indices] += (
+                normalized_incoming * weight
+            )
 
-                final_outgoing_nodes = self.__filter_nodes(
-                    symmetric_difference_weights, return_positive_weights=True
+            if not_last_hop[nf]:
+                meaningful_outward_forwardings += 1
+                logger.debug(
+                    f"Forwarding was not last hop: {amounts_out_msat[nf]}, "
+                    f"chan_id_out: {chan_id_out}"
                 )
-                final_incoming_nodes = self.__filter_nodes(
-                    symmetric_difference_weights, return_positive_weights=False
+                total_outgoing_neighbors[outgoing_indices] += (
+                    normalized_outgoing * weight
                 )
-
-                # normalize the weights
-                normalized_incoming = self.__normalize_neighbors(final_incoming_nodes)
-                normalized_outgoing = self.__normalize_neighbors(final_outgoing_nodes)
-
-                # set weight for each forwarding event
-                weight = 1
-                # alternatively:
-                # weight = f['amt_in']
-                # weight = f['fee_msat']
-
-                for n, nv in normalized_incoming.items():
-                    total_incoming_neighbors[n] += nv * weight
-
-                # If we know, that the outward hop already reached the
-                # target of the payment, we don't want to add the neighbors
-                # of the outgoing node to the total statistics.
-                # We know if the next hop was the final one of the payment by
-                # testing whether the forwarding amount in msat has remainder
-                # zero when divided by 1000 or not, provided the sent amount
-                # was larger than 1E6 msat.
-                if f["amt_out_msat"] % 1000:
-                    meaningful_outward_forwardings += 1
-                    logger.debug(
-                        f"Forwarding was not last hop: {f['amt_out_msat']}, "
-                        f"chan_id_out: {chan_id_out}"
-                    )
-                    for n, nv in normalized_outgoing.items():
-                        total_outgoing_neighbors[n] += nv * weight
         logger.info(
             f"Could use {meaningful_outward_forwardings} "
             f"forwardings to estimate targets of payments."
@@ -318,49 +519,54 @@ class ForwardingAnalyzer(object):
 
         # sort according to weights
         total_incoming_node_dict = self.__weighted_neighbors_to_sorted_dict(
-            total_incoming_neighbors
+            nodes, total_incoming_neighbors
         )
         total_outgoing_node_dict = self.__weighted_neighbors_to_sorted_dict(
-            total_outgoing_neighbors
+            nodes, total_outgoing_neighbors
         )
 
         return total_incoming_node_dict, total_outgoing_node_dict
 
     @staticmethod
-    def __weighted_neighbors_to_sorted_dict(node_dict):
+    def __weighted_neighbors_to_sorted_dict(nodes, weights):
         """
-        Converts a node weight dictionary to a sorted list of
-        nodes with weights.
+        Converts node weights to a dict of nodes with weights, sorted by
+        descending weight. Nodes without weight are left out.
 
-        :param node_dict: dict with key-value pairs of node_pub_key and weight
-        :return: sorted list
+        :param nodes: list of node_pub_keys
+        :param weights: np.ndarray, weights of the nodes
+        :return: sorted dict
         """
-        sorted_nodes_dict = OrderedDict()
-        node_list = [(n, nv) for n, nv in node_dict.items()]
-        node_list_sorted = sorted(node_list, key=lambda x: x[1], reverse=True)
-        for n, nv in node_list_sorted:
-            sorted_nodes_dict[n] = {"weight": nv}
-        return sorted_nodes_dict
-
-    def __determine_joined_neighbors(self, node_pub_key, excluded_nodes):
+        order = np.argsort(-weights, kind="stable")
+        order = order[weights[order] > 0]
+        return OrderedDict(
+            (nodes[i], {"weight": w}) for i, w in zip(order, weights[order].tolist())
+        )
+
+    def __determine_joined_neighbors(self, node_pub_key, node_indices):
         """Determines the joined set of nearest and second neighbors and assigns
         a weight to every node dependent how often they appear.
 
         :param node_pub_key: str, public key of the home node
-        :param excluded_nodes: list of str, public keys of excluded nodes
-                                            in analysis
-        :return: dict, keys: node_pub_keys, values: weights
+        :param node_indices: dict, keys: node_pub_keys, values: node indices
+        :return: (np.ndarray, np.ndarray), node indices sorted ascendingly and
+                 weights
         """
 
-        neighbors = list(self.node.network.neighbors(node_pub_key))
-        second_neighbors = list(self.node.network.second_neighbors(node_pub_key))
+        neighbors = [
+            node_indices[n] for n in self.node.network.neighbors(node_pub_key)
+        ]
+        second_neighbors = [
+            node_indices[n]
+            for n in self.node.network.second_neighbors(node_pub_key)
+        ]
 
         # determine neighbor node_weights
         neighbor_weights = self.__analyze_neighbors(
-            neighbors, excluded_nodes=excluded_nodes, weight=NEIGHBOR_WEIGHT
+            neighbors, weight=NEIGHBOR_WEIGHT
         )
         second_neighbor_weights = self.__analyze_neighbors(
-            second_neighbors, excluded_nodes=excluded_nodes, weight=NEXT_NEIGHBOR_WEIGHT
+            second_neighbors, weight=NEXT_NEIGHBOR_WEIGHT
         )
 
         # combine nearest and second nearest neighbor node weights
@@ -371,104 +577,71 @@ class ForwardingAnalyzer(object):
         return joined_neighbors
 
     @staticmethod
-    def __normalize_neighbors(neighbors_weight_dict):
+    def __normalize_neighbors(neighbor_weights):
         """
         Normalizes the weights of the neighbors to the total weight
         of all neighbors.
 
-        :param neighbors_weight_dict: dict, keys: node_pub_keys,
-                                            values: weights
-        :return: dict, keys: node_pub_keys, values: normalized weights
+        :param neighbor_weights: (np.ndarray, np.ndarray), node indices and
+                                 weights
+        :return: (np.ndarray, np.ndarray), node indices and normalized weights
         """
-        total_weight = 0
-        normalized_dict = {}
-        # determine total weight
-        for n, nv in neighbors_weight_dict.items():
-            total_weight += nv
-        # normalize
-        for n, nv in neighbors_weight_dict.items():
-            normalized_dict[n] = float(nv) / total_weight
-
-        return normalized_dict
+        indices, weights = neighbor_weights
+        return indices, weights / weights.sum()
 
     @staticmethod
-    def __analyze_neighbors(neighbors, excluded_nodes, weight):
+    def __analyze_neighbors(neighbors, weight):
         """
-        Analyzes a node dict for the frequency of nodes and gives them
+        Analyzes a list of nodes for the frequency of nodes and gives them
         a weight. An upper bound of the weights is set.
 
-        :param neighbors: list of node_pub_keys
-        :param excluded_nodes: excluded node_pub_keys for analysis
+        :param neighbors: list of node indices
         :param weight: float, weight for each individual appearance of a node
-        :return: dict, keys: node_pub_keys, values: node weights
+        :return: (np.ndarray, np.ndarray), node indices sorted ascendingly and
+                 node weights
         """
-        node_weights = {}
-
-        for n in neighbors:
-            if n not in excluded_nodes:
-                if n in node_weights.keys():
-                    node_weights[n] = min(node_weights[n] + weight, 1.0)
-                else:
-                    node_weights[n] = weight
-
-        return node_weights
+        indices, counts = np.unique(
+            np.asarray(neighbors, dtype=np.int64), return_counts=True
+        )
+        return indices, np.minimum(counts * weight, 1.0)
 
     @staticmethod
-    def __join_neighbors(first_neighbor_dict, second_neighbor_dict):
-        """Joins two node weight dicts together.
-        :param first_neighbor_dict: dict, keys: node_pub_keys,
-                                          values: node weights
-        :param second_neighbor_dict: dict, keys: node_pub_keys,
-                                           values: node weights
-        :return: dict, keys: node_pub_keys, values: node weights
+    def __join_neighbors(first_neighbors, second_neighbors):
+        """Joins two sets of node weights together.
+        :param first_neighbors: (np.ndarray, np.ndarray), node indices sorted
+                                ascendingly and node weights
+        :param second_neighbors: (np.ndarray, np.ndarray), node indices sorted
+                                 ascendingly and node weights
+        :return: (np.ndarray, np.ndarray), node indices sorted ascendingly and
+                 node weights
         """
-        # make a copy of the first node weight dict
-        joined_neighbor_dict = dict(first_neighbor_dict)
-
-        # add all the nodes from the second dict
-        for n, v in second_neighbor_dict.items():
-            if n in joined_neighbor_dict:
-                joined_neighbor_dict[n] = min(
-                    1, joined_neighbor_dict[n] + second_neighbor_dict[n]
-                )
-            else:
-                joined_neighbor_dict[n] = second_neighbor_dict[n]
-
-        return joined_neighbor_dict
+        indices, first, second, _, _ = _align_weights(
+            first_neighbors, second_neighbors
+        )
+        return indices, np.minimum(first + second, 1.0)
 
     @staticmethod
-    def __symmetric_difference(first_neighbors_dict, second_neighbors_dict):
+    def __symmetric_difference(first_neighbors, second_neighbors):
         """
-        Calculates the difference of weights of first and second node dicts,
+        Calculates the difference of weights of first and second nodes,
         doing also a symmetric difference between the sets of nodes.
 
-        :param first_neighbors_dict: dict, keys: node_pub_keys,
-                                           values: node weights
-        :param second_neighbors_dict: dict, keys: node_pub_keys,
-                                            values: node weights
-        :return: dict, keys: node_pub_keys, values: node weights
+        :param first_neighbors: (np.ndarray, np.ndarray), node indices sorted
+                                ascendingly and node weights
+        :param second_neighbors: (np.ndarray, np.ndarray), node indices sorted
+                                 ascendingly and node weights
+        :return: (np.ndarray, np.ndarray), node indices and node weights
         """
-        first_nodes = set(first_neighbors_dict.keys())
-        second_nodes = set(second_neighbors_dict.keys())
-
-        nodes_intersection = first_nodes.intersection(second_nodes)
-
-        unique_first_nodes = first_nodes - nodes_intersection
-        unique_second_nodes = second_nodes - nodes_intersection
-
-        diff_neighbor_dict = {}
-        for n in unique_first_nodes:
-            diff_neighbor_dict[n] = first_neighbors_dict[n]
-
-        for n in unique_second_nodes:
-            diff_neighbor_dict[n] = second_neighbors_dict[n]
+        indices, first, second, in_first, in_second = _align_weights(
+            first_neighbors, second_neighbors
+        )
 
-        for n in nodes_intersection:
-            delta = first_neighbors_dict[n] - second_neighbors_dict[n]
-            if delta != 0.0:
-                diff_neighbor_dict[n] = delta
+        # nodes unique to one of the sets keep their weight, for nodes in
+        # both sets the weights are subtracted
+        delta = np.where(in_first & in_second, first - second, first + second)
+        keep = delta != 0.0
 
-        return diff_neighbor_dict
+        return indices[keep], delta[keep]
 
     @staticmethod
     def __filter_nodes(node_weights, return_positive_weights=True):
@@ -476,82 +649,114 @@ class ForwardingAnalyzer(object):
         Filters out nodes with positive or negative weights and
         takes the absolute.
 
-        :param node_weights: dict
+        :param node_weights: (np.ndarray, np.ndarray), node indices and
+                             node weights
         :param return_positive_weights: bool, if True returns nodes with
                                               positive weights,
                                               if False negative weights
-        :return:
+        :return: (np.ndarray, np.ndarray), node indices and node weights
         """
-        new_node_weights = {}
-        for n, nv in node_weights.items():
-            if nv > 0 and return_positive_weights:
-                new_node_weights[n] = nv
-            elif nv < 0 and not return_positive_weights:
-                new_node_weights[n] = -nv
-        return new_node_weights
+        indices, weights = node_weights
+        if return_positive_weights:
+            keep = weights > 0
+            return indices[keep], weights[keep]
+        keep = weights < 0
+        return indices[keep], -weights[keep]
 
 
 class ForwardingStatistics(object):
     """Functionality to analyze the forwardings of a single node/channel."""
 
     def __init__(self):
-        self.inward_forwardings = []
-        self.outward_forwardings = []
-        self.timestamps = []
-        self.fees_out = []
-        self.fees_in = []
-
+        self.inward_forwardings = np.empty(0, dtype=np.int64)
+        self.outward_forwardings = np.empty(0, dtype=np.int64)
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.fees_out = np.empty(0, dtype=np.int64)
+        self.fees_in = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        inward_forwardings: np.ndarray,
+        outward_forwardings: np.ndarray,
+        timestamps: np.ndarray,
+        fees_in: np.ndarray,
+        fees_out: np.ndarray,
+    ) -> "ForwardingStatistics":
+        statistics = cls()
+        statistics.inward_forwardings = inward_forwardings
+        statistics.outward_forwardings = outward_forwardings
+        statistics.timestamps = timestamps
+        statistics.fees_in = fees_in
+        statistics.fees_out = fees_out
+        return statistics
+
+    @cached_property
     def total_forwarding_in(self) -> int:
-        return sum(self.inward_forwardings)
+        return int(self.inward_forwardings.sum())
 
+    @cached_property
     def total_forwarding_out(self) -> int:
-        return sum(self.outward_forwardings)
+        return int(self.outward_forwardings.sum())
 
+    @cached_property
     def mean_forwarding_in(self) -> float:
-        if len(self.inward_forwardings) > 0:
-            return np.mean(self.inward_forwardings)
+        if self.inward_forwardings.size:
+            return float(np.mean(self.inward_forwardings))
         return 0.0
 
+    @cached_property
     def mean_forwarding_out(self) -> float:
-        if len(self.outward_forwardings) > 0:
-            return np.mean(self.outward_forwardings)
+        if self.outward_forwardings.size:
+            return float(np.mean(self.outward_forwardings))
         return 0.0
 
+    @cached_property
     def median_forwarding_in(self) -> float:
-        if len(self.inward_forwardings) > 0:
-            return np.median(self.inward_forwardings)
-        return 0.0
+        forwardings = self.inward_forwardings
+        return float(_group_medians(np.zeros_like(forwardings), forwardings, 1)[0])
 
+    @cached_property
     def median_forwarding_out(self) -> float:
-        if len(self.outward_forwardings) > 0:
-            return np.median(self.outward_forwardings)
-        return 0.0
+        forwardings = self.outward_forwardings
+        return float(_group_medians(np.zeros_like(forwardings), forwardings, 1)[0])
 
+    @cached_property
     def total_fees_out(self) -> int:
-        return sum(self.fees_out)
+        return int(self.fees_out.sum())
 
+    @cached_property
     def total_fees_in(self) -> int:
-        return sum(self.fees_in)
+        return int(self.fees_in.sum())
 
+    @cached_property
     def largest_forwarding_amount_out(self) -> int:
-        return max(self.outward_forwardings, default=float("nan"))
+        if self.outward_forwardings.size:
+            return int(self.outward_forwardings.max())
+        return float("nan")
 
+    @cached_property
     def largest_forwarding_amount_in(self) -> int:
-        return max(self.inward_forwardings, default=float("nan"))
+        if self.inward_forwardings.size:
+            return int(self.inward_forwardings.max())
+        return float("nan")
 
+    @cached_property
     def flow_direction(self) -> float:
-        total_in = self.total_forwarding_in()
-        total_out = self.total_forwarding_out()
+        total_in = self.total_forwarding_in
+        total_out = self.total_forwarding_out
         try:
             return (-total_in + total_out) / (total_in + total_out)
         except ZeroDivisionError:
             return 0
 
+    @cached_property
     def number_forwardings(self) -> int:
-        return len(self.inward_forwardings) + len(self.outward_forwardings)
+        return self.inward_forwardings.size + self.outward_forwardings.size
 
+    @cached_property
     def number_forwardings_out(self):
-        return len(self.outward_forwardings)
+        return self.outward_forwardings.size
 
 
 def get_node_properites(
@@ -575,11 +780,16 @@ def get_node_properites(
     node_ids_with_open_channels = {nid for nid in channel_id_to_node_id.values()}
     open_channels = node.get_open_channels()
 
+    # fee rates and base fees are collected in lists, nodes have few channels,
+    # such that their medians are taken fastest without converting to arrays
     nodes_properties = {}  # type: Dict[str, NodeProperties]
 
     # for each channel, accumulate properties in node properties
     for k, c in open_channels.items():
         remote_pubkey = c["remote_pubkey"]
+        # we neglect nodes which won't show up in the output
+        if remote_pubkey not in node_ids_with_open_channels:
+            continue
         try:
             properties = nodes_properties[remote_pubkey]
         except KeyError:
@@ -587,69 +797,80 @@ def get_node_properites(
                 age=c["age"],
                 local_fee_rates=[c["local_fee_rate"]],
                 local_base_fees=[c["local_base_fee"]],
-                local_balances=[c["local_balance"]],
+                local_balance=c["local_balance"],
+                max_local_balance=c["local_balance"],
                 number_active_channels=1 if c["active"] else 0,
                 number_channels=1,
                 number_private_channels=1 if c["private"] else 0,
+                capacity=c["capacity"],
+                max_public_capacity=c["capacity"] if not c["private"] else 0,
                 remote_fee_rates=[c["peer_fee_rate"]],
                 remote_base_fees=[c["peer_base_fee"]],
-                remote_balances=[c["remote_balance"]],
+                remote_balance=c["remote_balance"],
+                max_remote_balance=c["remote_balance"],
                 sent_received_per_week=c["sent_received_per_week"],
-                public_capacities=[c["capacity"]] if not c["private"] else [],
-                private_capacites=[c["capacity"]] if c["private"] else [],
             )
         else:
-            properties.age = max(c["age"], nodes_properties[c["remote_pubkey"]].age)
+            if c["age"] > properties.age:
+                properties.age = c["age"]
             properties.local_fee_rates.append(c["local_fee_rate"])
             properties.local_base_fees.append(c["local_base_fee"])
-            properties.local_balances.append(c["local_balance"])
+            properties.local_balance += c["local_balance"]
+            if c["local_balance"] > properties.max_local_balance:
+                properties.max_local_balance = c["local_balance"]
             properties.number_active_channels += 1 if c["active"] else 0
             properties.number_channels += 1
             properties.number_private_channels += 1 if c["private"] else 0
+            properties.capacity += c["capacity"]
+            if not c["private"] and c["capacity"] > properties.max_public_capacity:
+                properties.max_public_capacity = c["capacity"]
             properties.remote_fee_rates.append(c["peer_fee_rate"])
             properties.remote_base_fees.append(c["peer_base_fee"])
-            properties.remote_balances.append(c["remote_balance"])
+            properties.remote_balance += c["remote_balance"]
+            if c["remote_balance"] > properties.max_remote_balance:
+                properties.max_remote_balance = c["remote_balance"]
             properties.sent_received_per_week += c["sent_received_per_week"]
-            if not c["private"]:
-                properties.public_capacities.append(c["capacity"])
-            else:
-                properties.private_capacites.append(c["capacity"])
 
     # unify node properties with forwarding data
     node_properties_forwardings = {}
-    # we start with looping over node properties, as this info is complete
-    for node_id, properties in nodes_properties.items():
-        local_balance = sum(properties.local_balances)
-        remote_balance = sum(properties.remote_balances)
-        capacity = sum(properties.private_capacites) + sum(properties.public_capacities)
-        # there can be old forwarding data, which we neglect
-        if node_id not in node_ids_with_open_channels:
-            continue
+    # we start with looping over node properties, as this info is complete,
+    # there can be old forwarding data, which we neglect
+    node_ids = list(nodes_properties)
+    local_balances = np.array(
+        [nodes_properties[nid].local_balance for nid in node_ids], dtype=np.int64
+    )
+    capacities = np.array(
+        [nodes_properties[nid].capacity for nid in node_ids], dtype=np.int64
+    )
+    # unbalancedness of all nodes at once, without commitment fee
+    unbalancednesses, _ = local_balance_to_unbalancedness(
+        local_balances, capacities, 0, False
+    )
+    node_alias = node.network.node_alias
+
+    for node_id, unbalancedness in zip(node_ids, unbalancednesses.tolist()):
+        properties = nodes_properties[node_id]
 
         # initial data:
         node_properties_forwardings[node_id] = {
             "age": properties.age,
-            "alias": node.network.node_alias(node_id),
-            "local_base_fee": np.median(properties.local_base_fees),
-            "local_fee_rate": np.median(properties.local_fee_rates),
-            "local_balance": local_balance,
-            "max_local_balance": max(properties.local_balances),
-            "max_remote_balance": max(properties.remote_balances),
+            "alias": node_alias(node_id),
+            "local_base_fee": float(median(properties.local_base_fees)),
+            "local_fee_rate": float(median(properties.local_fee_rates)),
+            "local_balance": properties.local_balance,
+            "max_local_balance": properties.max_local_balance,
+            "max_remote_balance": properties.max_remote_balance,
             "number_channels": properties.number_channels,
             "number_active_channels": properties.number_active_channels,
             "number_private_channels": properties.number_private_channels,
             "node_id": node_id,
-            "remote_base_fee": np.median(properties.remote_base_fees),
-            "remote_fee_rate": np.median(properties.remote_fee_rates),
-            "remote_balance": remote_balance,
+            "remote_base_fee": float(median(properties.remote_base_fees)),
+            "remote_fee_rate": float(median(properties.remote_fee_rates)),
+            "remote_balance": properties.remote_balance,
             "sent_reveived_per_week": properties.sent_received_per_week,
-            "total_capacity": capacity,
-            "max_public_capacity": max(properties.public_capacities)
-            if properties.public_capacities
-            else 0,
-            "unbalancedness": local_balance_to_unbalancedness(
-                local_balance, capacity, 0, False
-            )[0],
+            "total_capacity": properties.capacity,
+            "max_public_capacity": properties.max_public_capacity,
+            "unbalancedness": unbalancedness,
         }
 
         # add forwarding data if available:
@@ -727,10 +948,11 @@ def get_channel_properties(
         c["forwardings_per_channel_age"] = (
             chan_stats.get("number_forwardings", 0.01) / c["age"]
         )
+        # mean forwarding amounts are zero for no forwardings, never nan
         c["bandwidth_demand"] = (
             max(
-                nan_to_zero(chan_stats.get("mean_forwarding_in", 0)),
-                nan_to_zero(chan_stats.get("mean_forwarding_out", 0)),
+                chan_stats.get("mean_forwarding_in", 0),
+                chan_stats.get("mean_forwarding_out", 0),
             )
             / c["capacity"]
         )
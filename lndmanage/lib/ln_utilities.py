@@ -45,7 +45,8 @@ def extract_short_channel_id_from_string(string):
 
 def local_balance_to_unbalancedness(local_balance: int, capacity: int, commit_fee: int,
                                     initiator: bool) -> Tuple[float, int]:
-    """Calculates the unbalancedness.
+    """Calculates the unbalancedness, also for arrays of local balances and
+    capacities.
 
     :return: float:
         in [-1.0, 1.0]
@@ -23,7 +23,8 @@ from lndmanage.lib.ln_utilities import (
     convert_channel_id_to_short_channel_id,
     local_balance_to_unbalancedness
 )
-from lndmanage.lib.data_types import UTXO, AddressType
+from lndmanage.lib.data_types import UTXO, AddressType, FeePolicy
+from lndmanage.lib.exceptions import PolicyUpdateFailure
 from lndmanage.lib.user import yes_no_question
 from lndmanage.lib.utilities import convert_dictionary_number_strings_to_ints
 from lndmanage import settings
@@ -428,12 +429,12 @@ class LndNode:
         self.public_active_channels = \
             self.get_open_channels(
                 public_only=public_only, active_only=active_only)
+        excluded_channels = set(excluded_channels or ())
         channels = {
             k: c for k, c in self.public_active_channels.items()
             if abs(c['unbalancedness']) >= unbalancedness_greater_than
+            and k not in excluded_channels
         }
-        channels = {k: v for k, v in channels.items() if k not in (
-            excluded_channels if excluded_channels else [])}
         return channels
 
     def get_channel_fee_policies(self):
@@ -451,14 +452,17 @@ class LndNode:
             }
         return channels
 
-    def set_channel_fee_policies(self, channels: dict):
+    def set_channel_fee_policies(self, channels: Dict[str, FeePolicy]):
         """
-        Sets the node's channel fee policy for every channel.
+        Sets the node's channel fee policy for every channel. The updates are
+        sent concurrently.
         :param channels: channel point -> fee policy
+        :raises PolicyUpdateFailure: if updates failed, after all updates
+            finished
         """
-
-        for channel_point, channel_fee_policy in channels.items():
-            funding_txid, output_index = channel_point.split(':')
+        updates = {}
+        for channel_point_str, channel_fee_policy in channels.items():
+            funding_txid, output_index = channel_point_str.split(':')
             output_index = int(output_index)
 
             channel_point = lnd.ChannelPoint(
@@ -466,11 +470,25 @@ class LndNode:
 
             update_request = lnd.PolicyUpdateRequest(
                 chan_point=channel_point,
-                base_fee_msat=channel_fee_policy['base_fee_msat'],
-                fee_rate=channel_fee_policy['fee_rate'],
-                time_lock_delta=channel_fee_policy['cltv'],
+                base_fee_msat=channel_fee_policy.base_fee_msat,
+                fee_rate_ppm=channel_fee_policy.fee_rate_ppm,
+                time_lock_delta=channel_fee_policy.cltv,
             )
-            self._rpc.UpdateChannelPolicy(request=update_request)
+            updates[channel_point_str] = \
+                self._rpc.UpdateChannelPolicy.future(request=update_request)
+
+        # wait for all updates to finish before reporting failed ones
+        failures = {}
+        for channel_point_str, update in updates.items():
+            try:
+                update.result()
+            except grpc.RpcError as e:
+                logger.error(
+                    f"Fee policy update failed for channel "
+                    f"{channel_point_str}: {e}")
+                failures[channel_point_str] = e
+        if failures:
+            raise PolicyUpdateFailure(failures)
 
     @staticmethod
     def timestamp_from_now(offset_days=0):
@@ -688,15 +706,18 @@ class LndNode:
                 raise ConnectionRefusedError
         return succeeded_nodes
 
-    def pubkey_to_channel_map(self):
+    def pubkey_to_channel_map(self, channels: Dict[int, dict] = None):
         """
         Determines a dict with node pubkeys this node has a channel with, which
         maps to a list of all the channels with the node.
 
+        :param channels: channels as given by get_all_channels, fetched if
+            not given
         :return: dictionary of pubkeys with list of channels as value
         :rtype: dict[list]
         """
-        channels = self.get_all_channels()
+        if channels is None:
+            channels = self.get_all_channels()
 
         node_to_channel_map = defaultdict(list)
 
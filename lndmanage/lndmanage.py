@@ -1,42 +1,57 @@
 #!/usr/bin/env python
-import asyncio
 import argparse
-import time
 import os
 import sys
-import distutils.spawn as spawn
-# readline has a desired side effect on keyword input of enabling history
-import readline
+import shutil
 
-from lndmanage.lib.fee_setting import FeeSetter, optimization_parameters
-from lndmanage.lib.info import Info
-from lndmanage.lib.listings import ListChannels, ListPeers
-from lndmanage.lib.lncli import Lncli
-from lndmanage.lib.node import LndNode
-from lndmanage.lib.openchannels import ChannelOpener
-from lndmanage.lib.recommend_nodes import RecommendNodes
-from lndmanage.lib.report import Report
-
-from lndmanage import settings
+from lndmanage import settings, __version__
 
 import logging.config
 logging.config.dictConfig(settings.logger_config)
 logger = logging.getLogger()
 
-
-def range_limited_float_type(unchecked_value):
+LOGLEVELS = ('INFO', 'DEBUG')
+EXTERNAL_SOURCE_URL = (
+    'https://github.com/lightningnetworkstores/'
+    'lightningnetworkstores.github.io/raw/master/sites.json')
+SECOND_NEIGHBORS_DESCRIPTION = (
+    "This command recommends nodes for getting more "
+    "second neighbors. "
+    "This is achieved by checking how many second "
+    "neighbors would be added if one would connect to "
+    "the suggested node. A channel to the node "
+    "should get your node closer to "
+    "more other nodes.")
+UPDATE_FEES_DESCRIPTION = (
+    'Periodically running this command increases/decreases '
+    'the fees on all channels by adapting them according to '
+    'the forwarding demand in the last interval, which can '
+    'be set by the parameter --from-days-ago. The fee optimization '
+    'tries to keep a liquidity buffer for excess-demand times. '
+    'Channels can be excluded via the config section '
+    'excluded-channels-fee-opt.\n'
+    'The command will prompt the fees it would set after a yes/no question.'
+    "\n\n**Don't run this command too frequently (only once a week), "
+    "otherwise you put strain on the network and the new "
+    "fee policies won't reach end points like mobile phones "
+    "and you will route less.**")
+
+
+def range_limited_float_type(unchecked_value, lower=1E-6, upper=1.0):
     """
     Type function for argparse - a float within some predefined bounds
 
+    A non-numeric value raises a ValueError, which argparse reports as an
+    invalid float value.
+
     :param: unchecked_value: float
+    :param: lower: lower bound (inclusive)
+    :param: upper: upper bound (inclusive)
     """
-    try:
-        value = float(unchecked_value)
-    except ValueError:
-        raise argparse.ArgumentTypeError("Must be a floating point number")
-    if value < 1E-6 or value > 1:
+    value = float(unchecked_value)
+    if not lower <= value <= upper:
         raise argparse.ArgumentTypeError(
-            "Argument must be < " + str(1E-6) + " and > " + str(1))
+            f"{value} not in range [{lower}, {upper}]")
     return value
 
 
@@ -44,14 +59,50 @@ def unbalanced_float(x):
     """
     Checks if the value is a valid unbalancedness between [-1 ... 1]
     """
-    x = float(x)
-    if x < -1.0 or x > 1.0:
-        raise argparse.ArgumentTypeError(f"{x} not in range [-1.0, 1.0]")
-    return x
+    return range_limited_float_type(x, -1.0, 1.0)
+
+
+def _sniff_subcommand(argv, choices, options_with_value=()):
+    """
+    Finds the (sub)command to be run without parsing the command line. The
+    (sub)command is the first positional argument, options in front of it
+    and their values are skipped.
+
+    :param argv: command line arguments
+    :param choices: names of the (sub)commands
+    :param options_with_value: options in front of the (sub)command, which
+        take a value
+    :return: name of the (sub)command and its position in argv, (None, None)
+        if help is requested or if the first positional argument is no known
+        (sub)command
+    """
+    argv = argv or []
+    position = 0
+    while position < len(argv):
+        token = argv[position]
+        if token in ('-h', '--help'):
+            return None, None
+        if token == '--':
+            position += 1
+            break
+        if not token.startswith('-'):
+            break
+        # options can be abbreviated and can be given as --option=value
+        if '=' not in token and any(
+                o.startswith(token) for o in options_with_value):
+            position += 1
+        position += 1
+
+    if position < len(argv) and argv[position] in choices:
+        return argv[position], position
+    return None, None
 
 
 class Parser(object):
-    def __init__(self):
+    def __init__(self, argv=None):
+        """
+        :param argv: command line arguments, if None, all subparsers are built
+        """
 
         # figure out if lncli is available and determine path of executable
         self.lncli_path = None
@@ -63,13 +114,41 @@ class Parser(object):
             prog='lndmanage.py',
             description='Lightning network daemon channel management tool.')
         self.parser.add_argument(
-            '--loglevel', default='INFO', choices=['INFO', 'DEBUG'])
+            '--loglevel', default='INFO', choices=LOGLEVELS)
+        self.parser.add_argument(
+            '--version', action='version', version=f'%(prog)s {__version__}')
         subparsers = self.parser.add_subparsers(dest='cmd')
 
+        builders = {
+            'status': self._add_status_parser,
+            'listchannels': self._add_listchannels_parser,
+            'listpeers': self._add_listpeers_parser,
+            'recommend-nodes': self._add_recommend_nodes_parser,
+            'report': self._add_report_parser,
+            'info': self._add_info_parser,
+            'lncli': self._add_lncli_parser,
+            'openchannels': self._add_openchannels_parser,
+            'update-fees': self._add_update_fees_parser,
+        }
+        if not self.lncli_path:
+            del builders['lncli']
+
+        # only the subparser of the requested command is constructed, all of
+        # them are needed for help output or the interactive mode
+        cmd, position = _sniff_subcommand(
+            argv, builders, options_with_value=('--loglevel',))
+        # the arguments following the command, for sniffing its subcommand
+        self.cmd_argv = argv[position + 1:] if cmd else None
+        for name, add_parser in builders.items():
+            if cmd in (None, name):
+                add_parser(subparsers)
+
+    def _add_status_parser(self, subparsers):
         self.parser_status = subparsers.add_parser(
             'status', help='display node status',
             formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
+    def _add_listchannels_parser(self, subparsers):
         # cmd: listchannels
         self.parser_listchannels = subparsers.add_parser(
             'listchannels',
@@ -125,6 +204,7 @@ class Parser(object):
             '--sort-by', default='rev_nfwd/a', type=str,
             help='sort by column (look at description)')
 
+    def _add_listpeers_parser(self, subparsers):
         # cmd: listpeers
         self.parser_listpeers = subparsers.add_parser(
             'listpeers',
@@ -149,6 +229,7 @@ class Parser(object):
             'out',
             help="displays peers sorted by outward traffic")
 
+    def _add_recommend_nodes_parser(self, subparsers):
         # cmd: recommend-nodes
         self.parser_recommend_nodes = subparsers.add_parser(
             'recommend-nodes',
@@ -168,9 +249,27 @@ class Parser(object):
         # TODO: put global options to the
         #  parent parser (e.g. number of nodes, sort-by flag)
 
+        builders = {
+            'good-old': self._add_recommend_nodes_good_old_parser,
+            'flow-analysis': self._add_recommend_nodes_flow_analysis_parser,
+            'external-source':
+                self._add_recommend_nodes_external_source_parser,
+            'channel-openings':
+                self._add_recommend_nodes_channel_openings_parser,
+            'second-neighbors':
+                self._add_recommend_nodes_second_neighbors_parser,
+        }
+
+        # as for the commands, only the requested subcommand is constructed
+        subcmd, _ = _sniff_subcommand(self.cmd_argv, builders)
+        for name, add_parser in builders.items():
+            if subcmd in (None, name):
+                add_parser(parser_recommend_nodes_subparsers)
+
+    def _add_recommend_nodes_good_old_parser(self, subparsers):
         # subcmd: recommend-nodes good-old
         parser_recommend_nodes_good_old = \
-            parser_recommend_nodes_subparsers.add_parser(
+            subparsers.add_parser(
                 'good-old',
                 help='nodes with previous good relationship (channels)',
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -181,9 +280,10 @@ class Parser(object):
             '--sort-by', default='tot', type=str,
             help="sort by column [abbreviation, e.g. 'tot']")
 
+    def _add_recommend_nodes_flow_analysis_parser(self, subparsers):
         # subcmd: recommend-nodes flow-analysis
         parser_recommend_nodes_flow_analysis = \
-            parser_recommend_nodes_subparsers.add_parser(
+            subparsers.add_parser(
                 'flow-analysis', help='nodes from a flow analysis',
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
         parser_recommend_nodes_flow_analysis.add_argument(
@@ -200,9 +300,10 @@ class Parser(object):
             '--sort-by', default='weight', type=str,
             help="sort by column [abbreviation, e.g. 'nchan']")
 
+    def _add_recommend_nodes_external_source_parser(self, subparsers):
         # subcmd: recommend-nodes external_source
         parser_recommend_nodes_external_source = \
-            parser_recommend_nodes_subparsers.add_parser(
+            subparsers.add_parser(
                 'external-source',
                 help='nodes from a given file/url',
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -211,8 +312,7 @@ class Parser(object):
             help='sets the number of nodes displayed')
         parser_recommend_nodes_external_source.add_argument(
             '--source', type=str,
-            default='https://github.com/lightningnetworkstores/'
-                    'lightningnetworkstores.github.io/raw/master/sites.json',
+            default=EXTERNAL_SOURCE_URL,
             help='url/file to be analyzed')
         parser_recommend_nodes_external_source.add_argument(
             '--distributing-nodes', action='store_true',
@@ -222,9 +322,10 @@ class Parser(object):
             '--sort-by', default='cpc', type=str,
             help="sort by column [abbreviation, e.g. 'nchan']")
 
+    def _add_recommend_nodes_channel_openings_parser(self, subparsers):
         # subcmd: recommend-nodes channel-openings
         parser_recommend_nodes_channel_openings = \
-            parser_recommend_nodes_subparsers.add_parser(
+            subparsers.add_parser(
                 'channel-openings',
                 help='nodes from recent channel openings',
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -239,19 +340,14 @@ class Parser(object):
             '--sort-by', default='msteady', type=str,
             help="sort by column [abbreviation, e.g. 'nchan']")
 
+    def _add_recommend_nodes_second_neighbors_parser(self, subparsers):
         # subcmd: recommend-nodes second-neighbors
         parser_recommend_nodes_second_neighbors = \
-            parser_recommend_nodes_subparsers.add_parser(
+            subparsers.add_parser(
                 'second-neighbors',
                 help='nodes from network analysis giving most '
                      'second neighbors',
-                description="This command recommends nodes for getting more "
-                            "second neighbors. "
-                            "This is achieved by checking how many second "
-                            "neighbors would be added if one would connect to "
-                            "the suggested node. A channel to the node "
-                            "should get your node closer to "
-                            "more other nodes.",
+                description=SECOND_NEIGHBORS_DESCRIPTION,
                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
         parser_recommend_nodes_second_neighbors.add_argument(
             '--nnodes', default=20, type=int,
@@ -260,6 +356,7 @@ class Parser(object):
             '--sort-by', default='sec', type=str,
             help="sort by column [abbreviation, e.g. 'sec']")
 
+    def _add_report_parser(self, subparsers):
         # cmd: report
         parser_report = subparsers.add_parser(
             'report',
@@ -271,6 +368,7 @@ class Parser(object):
             '--to-days-ago', default=0, type=int,
             help='time interval end (days ago)')
 
+    def _add_info_parser(self, subparsers):
         # cmd: info
         parser_info = subparsers.add_parser(
             'info',
@@ -279,12 +377,13 @@ class Parser(object):
             'info_string', type=str,
             help='info string can represent a node public key or a channel id')
 
+    def _add_lncli_parser(self, subparsers):
         # cmd: lncli
-        if self.lncli_path:
-            parser_lncli = subparsers.add_parser(
+        subparsers.add_parser(
             'lncli',
             help='execute lncli')
 
+    def _add_openchannels_parser(self, subparsers):
         # cmd: openchannels
         self.parser_openchannels = subparsers.add_parser(
             'openchannels',
@@ -313,41 +412,31 @@ class Parser(object):
             type=str,
             help='Comma-separated list of node pubkeys.')
 
+    def _add_update_fees_parser(self, subparsers):
         # cmd: update-fees
         self.parser_update_fees = subparsers.add_parser(
             'update-fees',
-            description='Periodically running this command increases/decreases'
-                        'the fees on all channels by adapting them according to '
-                        'the forwarding demand in the last interval, which can '
-                        'be set by the parameter --from-days-ago. The fee optimization '
-                        'tries to keep a liquidity buffer for excess-demand times.'
-                        'Channels can be excluded via the config section'
-                        'excluded-channels-fee-opt.\n'
-                        'The command will prompt the fees it would set after a yes/no question.'
-                        "\n\n**Don't run this command too frequently (only once a week), "
-                        "otherwise you put strain on the network and the new"
-                        "fee policies won't reach end points like mobile phones"
-                        "and you will route less.**",
+            description=UPDATE_FEES_DESCRIPTION,
             help='optimize the fees on your channels to increase revenue and to automatically rebalance',
             formatter_class=argparse.RawDescriptionHelpFormatter)
         self.parser_update_fees.add_argument(
-            '--cltv', type=int, default=optimization_parameters['cltv'],
+            '--cltv', type=int, default=None,
             help='CLTV time delta.')
         self.parser_update_fees.add_argument(
             '--min-base-fee-msat', type=int,
-            default=optimization_parameters['min_base_fee'],
+            default=None,
             help='The base fee cannot go lower than this.')
         self.parser_update_fees.add_argument(
             '--max-base-fee-msat', type=int,
-            default=optimization_parameters['max_base_fee'],
+            default=None,
             help='The base fee cannot go higher than this.')
         self.parser_update_fees.add_argument(
             '--min-fee-rate', type=float,
-            default=optimization_parameters['min_fee_rate'],
+            default=None,
             help='The fee rate cannot go lower than this.')
         self.parser_update_fees.add_argument(
             '--max-fee-rate', type=float,
-            default=optimization_parameters['max_fee_rate'],
+            default=None,
             help='The fee rate cannot go higher than this.'
             'Half of this value is also used for initialization.'
         )
@@ -362,7 +451,7 @@ class Parser(object):
                  'update interval.')
         self.parser_update_fees.add_argument(
             '--target-forwarding-amount-sat', type=int,
-            default=optimization_parameters['r_t'],
+            default=None,
             help='The target for how much a channel should route per day.'
                  'The value of this parameter will influence how much you earn in forwarding'
                  'fees. If you set it too low, no forwardings will happen. If you set it too'
@@ -385,222 +474,37 @@ class Parser(object):
             self.lncli_path = lncli_candidate
         # look in PATH
         else:
-            path = spawn.find_executable('lncli')
+            path = shutil.which('lncli')
             self.lncli_path = path
 
     def parse_arguments(self):
         return self.parser.parse_args()
 
-    async def run_commands(self, node, args):
-        # program execution
-        if args.loglevel:
-            # update the loglevel of the stdout handler to the user choice
-            logger.handlers[0].setLevel(args.loglevel)
-
-        if args.cmd == 'status':
-            node.print_status()
-
-        elif args.cmd == 'listchannels':
-            listchannels = ListChannels(node)
-            if not args.subcmd:
-                listchannels.print_all_channels('rev_alias')
-            if args.subcmd == 'rebalance':
-                listchannels.print_channels_unbalanced(
-                    args.unbalancedness, sort_string=args.sort_by)
-            elif args.subcmd == 'inactive':
-                listchannels.print_channels_inactive(
-                    sort_string=args.sort_by)
-            elif args.subcmd == 'forwardings':
-                # convert time interval into unix timestamp
-                time_from = time.time() - args.from_days_ago * 24 * 60 * 60
-                time_to = time.time() - args.to_days_ago * 24 * 60 * 60
-                logger.info(
-                    f"Forwardings from {args.from_days_ago} days ago"
-                    f" to {args.to_days_ago} days ago are included.")
-                listchannels.print_channels_forwardings(
-                    time_interval_start=time_from, time_interval_end=time_to,
-                    sort_string=args.sort_by)
-            elif args.subcmd == 'hygiene':
-                time_from = time.time() - args.from_days_ago * 24 * 60 * 60
-                logger.info(f"Channel hygiene stats is over last "
-                            f"{args.from_days_ago} days.")
-                listchannels.print_channels_hygiene(
-                    time_interval_start=time_from, sort_string=args.sort_by)
-
-        elif args.cmd == 'listpeers':
-            listpeers = ListPeers(node)
-            time_from = time.time() - args.from_days_ago * 24 * 60 * 60
-            time_to = time.time()
-            logger.info(
-                f"Forwardings from {args.from_days_ago} days ago"
-                f" to now are included.")
-            if not args.subcmd:
-                listpeers.print_all_nodes(
-                    time_interval_start=time_from,
-                    time_interval_end=time_to,
-                    sort_string=args.sort_by,
-                )
-            elif args.subcmd == 'in':
-                listpeers.print_all_nodes(
-                    time_interval_start=time_from,
-                    time_interval_end=time_to,
-                    sort_string='in',
-                )
-            elif args.subcmd == 'out':
-                listpeers.print_all_nodes(
-                    time_interval_start=time_from,
-                    time_interval_end=time_to,
-                    sort_string='out',
-                )
-
-        elif args.cmd == 'recommend-nodes':
-            if not args.subcmd:
-                self.parser_recommend_nodes.print_help()
-                return 0
-
-            recommend_nodes = RecommendNodes(
-                node, show_connected=args.show_connected,
-                show_addresses=args.show_addresses)
-
-            if args.subcmd == 'good-old':
-                recommend_nodes.print_good_old(number_of_nodes=args.nnodes,
-                                               sort_by=args.sort_by)
-            elif args.subcmd == 'flow-analysis':
-                recommend_nodes.print_flow_analysis(
-                    out_direction=(not args.inwards),
-                    number_of_nodes=args.nnodes,
-                    forwarding_events=args.forwarding_events,
-                    sort_by=args.sort_by)
-            elif args.subcmd == 'external-source':
-                recommend_nodes.print_external_source(
-                    args.source, distributing_nodes=args.distributing_nodes,
-                    number_of_nodes=args.nnodes, sort_by=args.sort_by)
-            elif args.subcmd == 'channel-openings':
-                recommend_nodes.print_channel_openings(
-                    from_days_ago=args.from_days_ago,
-                    number_of_nodes=args.nnodes, sort_by=args.sort_by)
-            elif args.subcmd == 'second-neighbors':
-                recommend_nodes.print_second_neighbors(
-                    number_of_nodes=args.nnodes, sort_by=args.sort_by)
-
-        elif args.cmd == 'report':
-            time_from = time.time() - args.from_days_ago * 24 * 60 * 60
-            time_to = time.time() - args.to_days_ago * 24 * 60 * 60
-            report = Report(node, time_from, time_to)
-            report.report()
-
-        elif args.cmd == 'info':
-            info = Info(node)
-            info.parse_and_print(args.info_string)
-
-        elif args.cmd == 'openchannels':
-            channel_opener = ChannelOpener(node)
-            try:
-                channel_opener.open_channels(
-                    pubkeys=args.pubkeys,
-                    amounts=args.amounts,
-                    sat_per_vbyte=args.sat_per_vbyte,
-                    total_amount=args.total_amount,
-                    private=args.private,
-                )
-            except Exception as e:
-                logger.info(e)
-        elif args.cmd == 'update-fees':
-            # overwrite default optimization parameters
-            optimization_parameters['cltv'] = args.cltv
-            optimization_parameters['min_base_fee'] = args.min_base_fee_msat
-            optimization_parameters['max_base_fee'] = args.max_base_fee_msat
-            optimization_parameters['min_fee_rate'] = args.min_fee_rate
-            optimization_parameters['max_fee_rate'] = args.max_fee_rate
-            optimization_parameters['r_t'] = args.target_forwarding_amount_sat
-
-            feesetter = FeeSetter(
-                node,
-                from_days_ago=args.from_days_ago,
-                parameters=optimization_parameters
-            )
-
-            feesetter.set_fees(
-                init=args.init,
-                reckless=args.reckless
-            )
-
-
-async def _main():
-    parser = Parser()
-
-    # config.ini is expected to be in home/.lndmanage directory
-    config_file = os.path.join(settings.home_dir, 'config.ini')
 
+def main():
     # if lndmanage is run with arguments, run once
     if len(sys.argv) > 1:
-        # take arguments from sys.argv
+        parser = Parser(sys.argv[1:])
+
+        # take arguments from sys.argv, help, version and argument errors
+        # exit here, before the event loop is started
         args = parser.parse_arguments()
 
-        lndnode = LndNode(config_file=config_file)
-        async with lndnode:
-            await parser.run_commands(lndnode, args)
+        # the lnd interface is only imported for command execution
+        from lndmanage.cli_exec import execute
+        run = execute(parser, args)
 
     # otherwise enter an interactive mode
     else:
-        history_file = os.path.join(settings.home_dir, "command_history")
-        try:
-            readline.read_history_file(history_file)
-        except FileNotFoundError:
-            # history will be written later
-            pass
-
-        logger.info("Running in interactive mode. "
-                    "You can type 'help' or 'exit'.")
-
-        lndnode = LndNode(config_file=config_file)
-        async with lndnode:
-            if parser.lncli_path:
-                logger.info("> Enabled lncli: using " + parser.lncli_path)
-
-            while True:
-                try:
-                    user_input = input("$ lndmanage ")
-                except KeyboardInterrupt:
-                    logger.info("")
-                    continue
-                except EOFError:
-                    readline.write_history_file(history_file)
-                    logger.info("exit")
-                    return 0
-
-                if not user_input or user_input in ['help', '-h', '--help']:
-                    parser.parser.print_help()
-                    continue
-                elif user_input == 'exit':
-                    readline.write_history_file(history_file)
-                    return 0
-
-                args_list = user_input.split(" ")
-
-                # lncli execution
-                if args_list[0] == 'lncli':
-                    if parser.lncli_path:
-                        lncli = Lncli(parser.lncli_path, config_file)
-                        lncli.lncli(args_list[1:])
-                        continue
-                    else:
-                        logger.info("lncli not enabled, put lncli in PATH or in ~/.lndmanage")
-                        continue
-                try:
-                    # need to run with parse_known_args to get an exception
-                    args = parser.parser.parse_args(args_list)
-                    await parser.run_commands(lndnode, args)
-                except SystemExit:
-                    # argparse may raise SystemExit on incorrect user input,
-                    # which is a graceful exit. The user gets the standard output
-                    # from argparse of what went wrong.
-                    continue
+        parser = Parser()
 
+        from lndmanage.cli_exec import interactive
+        run = interactive(parser)
 
-def main():
-    asyncio.run(_main())
+    # asyncio is not needed for help output, we import it on demand
+    import asyncio
+    asyncio.run(run)
 
 
 if __name__ == '__main__':
-    asyncio.run(_main())
+    main()
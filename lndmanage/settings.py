@@ -1,7 +1,6 @@
 import os
 from ast import literal_eval
-import configparser
-from lndmanage.lib.configure import check_or_create_configuration
+from lndmanage.lib.configure import check_or_create_configuration, load_config
 from pathlib import Path
 
 def parse_env(key, default, _type=str):
@@ -36,6 +35,7 @@ UNBALANCED_CHANNEL = parse_env('LNDMANAGE_UNBALANCED_CHANNEL_CEIL', '0.2', float
 
 logger_config = None
 home_dir = None
+config_file = None
 
 
 def set_lndmanage_home_dir(directory=None):
@@ -45,7 +45,7 @@ def set_lndmanage_home_dir(directory=None):
     :param directory: home folder, overwrites default
     :type directory: str
     """
-    global home_dir, logger_config
+    global home_dir, config_file, logger_config
 
     if directory:
         home_dir = directory
@@ -68,6 +68,9 @@ def set_lndmanage_home_dir(directory=None):
         # we need to create the configuration
         check_or_create_configuration(home_dir)
 
+    # config.ini is expected to be in the lndmanage home directory
+    config_file = os.path.join(home_dir, 'config.ini')
+
     # logger settings
     logfile_path = os.path.join(home_dir, 'lndmanage.log')
 
@@ -110,9 +113,7 @@ def set_lndmanage_home_dir(directory=None):
 
 
 def read_config(config_path):
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    return config
+    return load_config(config_path)
 
 
 set_lndmanage_home_dir()
@@ -0,0 +1,35 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from test import testing_common  # sets up the lndmanage home directory
+
+from lndmanage.cli_exec import run_commands
+from lndmanage.lib.fee_setting import optimization_parameters
+from lndmanage.lndmanage import Parser
+
+
+class TestUpdateFees(TestCase):
+    def run_update_fees(self, argv):
+        """Runs update-fees with argv like in the interactive mode and returns
+        the parameters passed to the fee setter."""
+        parser = Parser()
+        args = parser.parser.parse_args(['update-fees'] + argv)
+        with patch('lndmanage.cli_exec.FeeSetter') as fee_setter:
+            asyncio.run(run_commands(parser, None, args))
+        return fee_setter.call_args.kwargs['parameters']
+
+    def test_overrides_are_not_inherited(self):
+        defaults = dict(optimization_parameters)
+
+        self.assertEqual(
+            {'cltv': 60, 'max_fee_rate': 0.001},
+            self.run_update_fees(['--cltv', '60', '--max-fee-rate', '0.001']),
+        )
+        # a later run in the same session starts from the defaults
+        self.assertEqual({}, self.run_update_fees([]))
+        self.assertEqual(
+            {'min_base_fee': 10},
+            self.run_update_fees(['--min-base-fee-msat', '10']),
+        )
+        self.assertEqual(defaults, optimization_parameters)
@@ -0,0 +1,73 @@
+import contextlib
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from lndmanage.lib import configure
+from lndmanage.lib.configure import load_config, valid_host
+
+
+class TestValidHost(TestCase):
+    def assertInvalidHost(self, host):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(valid_host(host))
+
+    def test_valid_hosts(self):
+        for host in (
+            '127.0.0.1:10009',
+            'localhost:10009',
+            '[::1]:10009',
+            '[2001:db8::1]:65535',
+        ):
+            self.assertEqual(host, valid_host(host))
+
+    def test_invalid_hosts(self):
+        for host in (
+            'host:abc',
+            'host:99999',
+            'host:65536',
+            'host:0',
+            'host',
+            '::1:10009',
+            '127.0.0.1:',
+        ):
+            self.assertInvalidHost(host)
+
+
+class TestLoadConfig(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.config_path = os.path.join(directory.name, 'config.ini')
+        self.write_config('[network]\nlnd_grpc_host = localhost:10009\n', 1)
+
+    def write_config(self, text, mtime):
+        with open(self.config_path, 'w') as f:
+            f.write(text)
+        os.utime(self.config_path, ns=(mtime, mtime))
+
+    def test_unchanged_file_is_parsed_once(self):
+        config = load_config(self.config_path)
+        values = configure._CONFIG_CACHE[self.config_path][1]
+        self.assertEqual('localhost:10009', config['network']['lnd_grpc_host'])
+
+        # changes by one caller are not seen by the next one
+        config['network']['lnd_grpc_host'] = 'changed:10009'
+        config.add_section('added')
+        config = load_config(self.config_path)
+        self.assertIs(values, configure._CONFIG_CACHE[self.config_path][1])
+        self.assertEqual('localhost:10009', config['network']['lnd_grpc_host'])
+        self.assertFalse(config.has_section('added'))
+
+    def test_modified_file_is_parsed_again(self):
+        load_config(self.config_path)
+        # same modification time, but a different size
+        self.write_config('[network]\nlnd_grpc_host = remote:10009\n', 1)
+        config = load_config(self.config_path)
+        self.assertEqual('remote:10009', config['network']['lnd_grpc_host'])
+
+        # same size, but a different modification time
+        self.write_config('[network]\nlnd_grpc_host = distal:10009\n', 2)
+        config = load_config(self.config_path)
+        self.assertEqual('distal:10009', config['network']['lnd_grpc_host'])
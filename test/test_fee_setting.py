@@ -1,27 +1,154 @@
+from collections import defaultdict
+from configparser import ConfigParser
+from dataclasses import fields
 from unittest import TestCase
+import json
+import os
 import sys
 import logging
+import tempfile
+import time
+
+import numpy as np
 
 from test import testing_common
 
-from lndmanage.lib.fee_setting import delta_demand, delta_min, optimization_parameters
+from lndmanage.lib.data_types import FeePolicy
+from lndmanage.lib.fee_setting import (
+    FeeSetter,
+    OptimizationParameters,
+    delta_demand,
+    delta_demand_vec,
+    delta_min,
+    delta_min_vec,
+    optimization_parameters,
+)
 
 testing_common.logger.addHandler(logging.StreamHandler(sys.stdout))
 
+DAY = 24 * 60 * 60
+
+
+def channel_point(channel_id):
+    return f"{channel_id:064x}:0"
+
+
+class FakeNetwork(object):
+    @staticmethod
+    def node_alias(pub_key):
+        return pub_key.upper()
+
+
+class FakeNode(object):
+    """Node with three peers, where peer_a has two channels with
+    forwardings, peer_b has a channel without forwardings and peer_c has an
+    excluded channel."""
+
+    pub_key = "own_node"
+
+    def __init__(self, now):
+        self.network = FakeNetwork()
+        self.channels = {}
+        self.policies = {}
+        for channel_id, pub_key, capacity, local_balance, fee_per_mil, base_fee in (
+            (1, "peer_a", 1000000, 200000, 100, 1000),
+            (2, "peer_a", 2000000, 1500000, 201, 0),
+            (3, "peer_b", 5000000, 4000000, 1000, 1000),
+            (4, "peer_b", 500000, 100000, 10, 500),
+            (5, "peer_c", 1000000, 500000, 50, 1000),
+        ):
+            self.channels[channel_id] = {
+                "remote_pubkey": pub_key,
+                "capacity": capacity,
+                "local_balance": local_balance,
+                "channel_point": channel_point(channel_id),
+                "unbalancedness": -(2 * local_balance / capacity - 1),
+            }
+            self.policies[channel_point(channel_id)] = {
+                "base_fee_msat": base_fee,
+                "fee_per_mil": fee_per_mil,
+                "fee_rate": fee_per_mil / 1E6,
+            }
+        # forwardings (days ago, channel in, channel out, amount out in sat),
+        # the last one is too old to be considered
+        self.forwarding_events = [
+            {
+                "timestamp": int(now - days_ago * DAY),
+                "chan_id_in": chan_id_in,
+                "chan_id_out": chan_id_out,
+                "amt_in": amount + 1,
+                "amt_out": amount,
+                "amt_out_msat": amount * 1000,
+                "fee_msat": 1000,
+            }
+            for days_ago, chan_id_in, chan_id_out, amount in (
+                (6, 3, 1, 100000),
+                (5, 3, 1, 50000),
+                (4, 3, 2, 400000),
+                (3, 5, 2, 20000),
+                (2, 1, 5, 30000),
+                (10, 3, 1, 1000000),
+            )
+        ]
+        self.config = ConfigParser()
+        self.config.read_dict({"excluded-channels-fee-opt": {"5": ""}})
+        self.policy_updates = []
+
+    def get_forwarding_events(self):
+        return self.forwarding_events
+
+    def get_all_channels(self):
+        return self.channels
+
+    def get_open_channels(self):
+        return self.channels
+
+    def get_closed_channels(self):
+        return {}
+
+    def channel_id_to_node_id(self, open_only=False):
+        return {cid: c["remote_pubkey"] for cid, c in self.channels.items()}
+
+    def pubkey_to_channel_map(self, channels=None):
+        node_to_channel_map = defaultdict(list)
+        for c, cv in (channels or self.channels).items():
+            node_to_channel_map[cv["remote_pubkey"]].append(c)
+        return node_to_channel_map
+
+    def get_channel_fee_policies(self):
+        return self.policies
+
+    def set_channel_fee_policies(self, channels):
+        self.policy_updates.append(channels)
+
 
 class TestFeeSetter(TestCase):
+    params = OptimizationParameters(**optimization_parameters)
+
+    def test_optimization_parameters_from_dict(self):
+        # every default parameter is a field
+        self.assertEqual(
+            set(optimization_parameters),
+            {f.name for f in fields(OptimizationParameters)},
+        )
+        # missing parameters are completed, unknown keys are ignored
+        params = OptimizationParameters.from_dict({"cltv": 144, "unknown": 1})
+        self.assertEqual(144, params.cltv)
+        self.assertEqual(optimization_parameters["r_t"], params.r_t)
+        self.assertEqual(self.params, OptimizationParameters.from_dict({}))
+
     def test_delta_min(self):
         cap = 2000000
         # maximal upward adjustment for empty local balance
         self.assertAlmostEqual(
             1 + optimization_parameters["delta_min_up"],
-            delta_min(optimization_parameters, local_balance=0, capacity=cap),
+            delta_min(self.params, local_balance=0, capacity=cap),
         )
         # no adjustment if local balance is balance reserve
         self.assertAlmostEqual(
             1,
             delta_min(
-                optimization_parameters,
+                self.params,
                 local_balance=optimization_parameters["local_balance_reserve"],
                 capacity=cap,
             ),
@@ -29,7 +156,7 @@ class TestFeeSetter(TestCase):
         # maximal downward adjustment for full local balance
         self.assertAlmostEqual(
             1 - optimization_parameters["delta_min_dn"],
-            delta_min(optimization_parameters, local_balance=cap, capacity=cap),
+            delta_min(self.params, local_balance=cap, capacity=cap),
         )
 
     def test_factor_demand_fee_rate(self):
@@ -39,7 +166,7 @@ class TestFeeSetter(TestCase):
         self.assertAlmostEqual(
             1 - optimization_parameters["delta_min_dn"],
             delta_demand(
-                optimization_parameters,
+                self.params,
                 time_interval=interval_days,
                 amount_out=0,
                 local_balance=cap,
@@ -52,7 +179,7 @@ class TestFeeSetter(TestCase):
         self.assertAlmostEqual(
             1 + optimization_parameters["delta_min_up"],
             delta_demand(
-                optimization_parameters,
+                self.params,
                 time_interval=interval_days,
                 amount_out=0,
                 local_balance=0,
@@ -65,7 +192,7 @@ class TestFeeSetter(TestCase):
         self.assertAlmostEqual(
             1,
             delta_demand(
-                optimization_parameters,
+                self.params,
                 time_interval=interval_days,
                 amount_out=optimization_parameters["r_t"] * interval_days,
                 local_balance=cap,
@@ -78,7 +205,7 @@ class TestFeeSetter(TestCase):
         self.assertAlmostEqual(
             optimization_parameters["delta_max"],
             delta_demand(
-                optimization_parameters,
+                self.params,
                 time_interval=interval_days,
                 amount_out=1000000,
                 local_balance=cap,
@@ -86,3 +213,197 @@ class TestFeeSetter(TestCase):
             ),
             places=6,
         )
+
+
+    def test_delta_min_vec(self):
+        params = self.params
+        reserve = params.local_balance_reserve
+        # small channels lower the reserve to a third of their capacity
+        capacity = np.array([2000000, 2000000, 2000000, 600000, 600000])
+        local_balance = np.array([0, reserve, 2000000, 0, 600000])
+        np.testing.assert_allclose(
+            [
+                1 + params.delta_min_up,
+                1,
+                1 - params.delta_min_dn,
+                1 + params.delta_min_up,
+                1 - params.delta_min_dn,
+            ],
+            delta_min_vec(params, local_balance, capacity),
+        )
+        # vector and scalar versions agree
+        for lb, cap in zip(local_balance, capacity):
+            self.assertAlmostEqual(
+                delta_min(params, lb, cap),
+                delta_min_vec(params, [lb], [cap])[0],
+            )
+
+        # tiny or empty channels leave no range to adjust the fees in
+        with self.assertRaises(ZeroDivisionError):
+            delta_min_vec(params, [0, 0], [1000000, 2])
+        with self.assertRaises(ZeroDivisionError):
+            delta_min_vec(params, [0, 0], [1000000, 0])
+        with self.assertRaises(ZeroDivisionError):
+            delta_min(params, local_balance=0, capacity=0)
+
+        # a single inconsistent channel fails the batch
+        with self.assertRaisesRegex(ValueError, "3000001 / 3000000"):
+            delta_min_vec(
+                params, [0, 3000001, 100], [1000000, 3000000, 1000000]
+            )
+
+    def test_delta_demand_vec(self):
+        params = self.params
+        interval_days = 7
+        cap = 2000000
+        amount_out = np.array(
+            [0, 0, params.r_t * interval_days, 1000000, params.r_t * 7.7]
+        )
+        local_balance = np.array([cap, 0, cap, cap, cap])
+        capacity = np.full(5, cap)
+        np.testing.assert_allclose(
+            [
+                # capped from below by delta_min
+                1 - params.delta_min_dn,
+                1 + params.delta_min_up,
+                # uncapped
+                1,
+                # capped from above by delta_max
+                params.delta_max,
+                1 + params.delta_min_dn * 0.1,
+            ],
+            delta_demand_vec(
+                params, interval_days, amount_out, local_balance, capacity
+            ),
+        )
+
+        with self.assertRaises(ValueError):
+            delta_demand_vec(
+                params, interval_days, [0, 0], [0, cap + 1], [cap, cap]
+            )
+
+
+class TestFeeSetterPolicies(TestCase):
+    # keys of the fee update statistics records
+    record_keys = (
+        "channelid", "total_in", "total_out", "lb", "ub", "flow", "fees",
+        "cap", "fdem", "fr", "frn", "nfwd", "nfwdo", "fbase", "bf", "bfn",
+    )
+
+    def setUp(self):
+        self.now = time.time()
+        self.node = FakeNode(self.now)
+        self.fee_setter = FeeSetter(self.node)
+
+    def assertRecords(self, expected_records, records):
+        self.assertEqual(len(expected_records), len(records))
+        for expected, record in zip(expected_records, records):
+            self.assertGreaterEqual(record["date"], self.now)
+            for key, value in zip(self.record_keys, expected):
+                self.assertAlmostEqual(value, record[key], places=9, msg=key)
+
+    def test_new_fee_policies(self):
+        policies, records = self.fee_setter.new_fee_policies()
+
+        # peer_a has a high demand, its fee rate of 150.5 ppm is increased
+        # by the maximal factor 1.5, peer_b's fee rate of 505 ppm is lowered
+        # by a factor of 0.64 for missing demand and a high local balance,
+        # the excluded channel of peer_c is not updated
+        self.assertEqual(
+            {
+                channel_point(1): FeePolicy(500, 226, 40),
+                channel_point(2): FeePolicy(500, 226, 40),
+                channel_point(3): FeePolicy(562, 323, 40),
+                channel_point(4): FeePolicy(562, 323, 40),
+            },
+            policies,
+        )
+        for policy in policies.values():
+            self.assertIsInstance(policy.base_fee_msat, int)
+            self.assertIsInstance(policy.fee_rate_ppm, int)
+
+        fdem_a = 226 / 150.5
+        fdem_b = 323 / 505
+        fbase_b = 562 / 750
+        self.assertRecords(
+            [
+                (1, 30001, 150000, 200000, 0.6, 0.6666574074588475, 2.0,
+                 1000000, fdem_a, 0.0001, 0.000226, 3, 2, 1.0, 1000, 500),
+                (2, 0, 420000, 1500000, -0.5, 1.0, 2.0,
+                 2000000, fdem_a, 0.000201, 0.000226, 2, 2, 1.0, 0, 500),
+                (3, 550003, 0, 4000000, -0.6, -1.0, 0.0,
+                 5000000, fdem_b, 0.001, 0.000323, 3, 0, fbase_b, 1000, 562),
+                # a channel without forwardings
+                (4, 0, 0, 100000, 0.6, 0, 0.0,
+                 500000, fdem_b, 0.00001, 0.000323, 0, 0, fbase_b, 500, 562),
+                # the excluded channel is reported nevertheless
+                (5, 20001, 30000, 500000, 0.0, 0.1999760004799904, 1.0,
+                 1000000, 1.0, 0.00005, 0.00005, 2, 1, 0.75, 1000, 750),
+            ],
+            records,
+        )
+
+    def test_new_fee_policies_init(self):
+        policies, records = self.fee_setter.new_fee_policies(init=True)
+
+        # fee rates start at half the maximal fee rate and base fees at the
+        # minimal base fee
+        self.assertEqual(
+            {channel_point(c): FeePolicy(0, 2500, 40) for c in (1, 2, 3, 4)},
+            policies,
+        )
+        self.assertEqual([1, 2, 3, 4, 5], [r["channelid"] for r in records])
+        self.assertEqual([0.0025] * 5, [r["frn"] for r in records])
+        self.assertEqual([0] * 5, [r["bfn"] for r in records])
+
+    def test_history(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fee_setter.history_path = os.path.join(directory.name, "history")
+
+        _, records = self.fee_setter.new_fee_policies()
+        self.fee_setter.append_to_history(records)
+        self.fee_setter.append_to_history(records[:1])
+
+        # one line per fee update in the default json format
+        with open(self.fee_setter.history_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([json.dumps(records), json.dumps(records[:1])], lines)
+        self.assertEqual([records, records[:1]], self.fee_setter.read_history())
+
+    def new_fee_rates(self, init=False, **parameters):
+        """Returns the new fee rates in ppm for the channels of peer_a and
+        peer_b."""
+        fee_setter = FeeSetter(self.node, parameters=parameters)
+        policies, _ = fee_setter.new_fee_policies(init)
+        return [policies[channel_point(c)].fee_rate_ppm for c in (1, 3)]
+
+    def test_fee_rate_rounding(self):
+        # without a change, peer_a's mean fee rate of 150.5 ppm is rounded
+        # half up
+        self.assertEqual([151, 323], self.new_fee_rates(delta_max=1.0))
+
+    def test_fee_rate_limits(self):
+        self.assertEqual([400, 400], self.new_fee_rates(min_fee_rate=0.0004))
+        self.assertEqual([226, 300], self.new_fee_rates(max_fee_rate=0.0003))
+
+    def test_fee_rate_init(self):
+        # half the maximal fee rate, rounded down
+        self.assertEqual(
+            [499, 499], self.new_fee_rates(init=True, max_fee_rate=0.000999)
+        )
+
+    def test_set_fees(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.fee_setter.history_path = os.path.join(directory.name, "history")
+
+        self.fee_setter.set_fees(reckless=True)
+
+        self.assertEqual(1, len(self.node.policy_updates))
+        policies = self.node.policy_updates[0]
+        self.assertEqual(4, len(policies))
+        for policy in policies.values():
+            self.assertIs(int, type(policy.base_fee_msat))
+            self.assertIs(int, type(policy.fee_rate_ppm))
+            self.assertIs(int, type(policy.cltv))
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+import numpy as np
+
+from lndmanage.lib.forwardings import ForwardingStatistics, _group_medians
+
+
+class TestMedians(TestCase):
+    def test_group_medians(self):
+        # group 0 has an odd, group 2 an even number of values, group 1 and
+        # group 4 have none, values are not sorted within a group
+        groups = {
+            0: [5, 1, 3],
+            2: [40, 10, 30, 20],
+            3: [7],
+        }
+        indices = np.array([g for g, vs in groups.items() for _ in vs])
+        values = np.array([v for vs in groups.values() for v in vs])
+        order = np.random.default_rng(0).permutation(indices.size)
+
+        medians = _group_medians(indices[order], values[order], 5)
+
+        self.assertEqual(5, medians.size)
+        for group in range(5):
+            expected = np.median(groups[group]) if group in groups else 0
+            self.assertEqual(expected, medians[group])
+
+    def test_forwarding_statistics_medians(self):
+        statistics = ForwardingStatistics.from_arrays(
+            inward_forwardings=np.array([3, 100, 7, 1], dtype=np.int64),
+            outward_forwardings=np.array([9, 2, 4], dtype=np.int64),
+            timestamps=np.array([1, 2, 3], dtype=np.int64),
+            fees_in=np.zeros(4, dtype=np.int64),
+            fees_out=np.zeros(3, dtype=np.int64),
+        )
+        self.assertEqual(5.0, statistics.median_forwarding_in)
+        self.assertEqual(4.0, statistics.median_forwarding_out)
+        self.assertEqual(0.0, ForwardingStatistics().median_forwarding_in)
@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+import numpy as np
+
 from lndmanage.lib.ln_utilities import (
     local_balance_to_unbalancedness,
     unbalancedness_to_local_balance,
@@ -34,3 +36,14 @@ class LnUtilityTest(TestCase):
                 unbalancedness_to_local_balance(ub, cap, cf, True)[0], cap, cf, True
             )[0],
         )
+
+    def test_unbalancedness_arrays(self):
+        local_balances = np.array([0, 250000, 500000, 1000000])
+        capacities = np.array([1000000, 1000000, 1000000, 1000000])
+        unbalancednesses, _ = local_balance_to_unbalancedness(
+            local_balances, capacities, 0, False
+        )
+        for lb, cap, ub in zip(local_balances, capacities, unbalancednesses):
+            self.assertAlmostEqual(
+                local_balance_to_unbalancedness(int(lb), int(cap), 0, False)[0], ub
+            )
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+import grpc
+
+from lndmanage.lib.data_types import FeePolicy
+from lndmanage.lib.exceptions import PolicyUpdateFailure
+from lndmanage.lib.node import LndNode
+
+
+class FakeFuture(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.awaited = False
+
+    def result(self):
+        self.awaited = True
+        if self.error:
+            raise self.error
+
+
+class FakeUpdateChannelPolicy(object):
+    def __init__(self, failing_txids):
+        self.failing_txids = failing_txids
+        self.futures = []
+
+    def future(self, request):
+        if request.chan_point.funding_txid_str in self.failing_txids:
+            future = FakeFuture(grpc.RpcError('update failed'))
+        else:
+            future = FakeFuture()
+        self.futures.append(future)
+        return future
+
+
+class FakeRPC(object):
+    def __init__(self, failing_txids):
+        self.UpdateChannelPolicy = FakeUpdateChannelPolicy(failing_txids)
+
+
+class FakeNode(object):
+    def __init__(self, failing_txids=()):
+        self._rpc = FakeRPC(failing_txids)
+
+
+class TestSetChannelFeePolicies(TestCase):
+    policies = {
+        f'{i:064x}:{i}': FeePolicy(1000, 100 * i, 40) for i in range(1, 5)}
+
+    def test_all_updates_succeed(self):
+        node = FakeNode()
+        LndNode.set_channel_fee_policies(node, self.policies)
+        futures = node._rpc.UpdateChannelPolicy.futures
+        self.assertEqual(4, len(futures))
+        self.assertTrue(all(f.awaited for f in futures))
+
+    def test_failed_update(self):
+        node = FakeNode(failing_txids={f'{2:064x}'})
+        with self.assertRaises(PolicyUpdateFailure) as context:
+            LndNode.set_channel_fee_policies(node, self.policies)
+
+        # the failed channel is reported after all updates finished
+        self.assertEqual([f'{2:064x}:2'], list(context.exception.failures))
+        self.assertTrue(
+            all(f.awaited for f in node._rpc.UpdateChannelPolicy.futures))
@@ -0,0 +1,123 @@
+import contextlib
+import io
+from unittest import TestCase
+
+from test import testing_common  # sets up the lndmanage home directory
+
+from lndmanage import __version__
+from lndmanage.lndmanage import Parser, _sniff_subcommand
+
+RECOMMEND_NODES_SUBCOMMANDS = (
+    'good-old',
+    'flow-analysis',
+    'external-source',
+    'channel-openings',
+    'second-neighbors',
+)
+
+
+class TestParser(TestCase):
+    def parse(self, argv):
+        """Parses argv, returns the parser, the arguments (None if the
+        parser exited), the exit code and the captured stdout and stderr."""
+        parser = Parser(argv)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        args, code = None, None
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                args = parser.parser.parse_args(argv)
+            except SystemExit as e:
+                code = e.code
+        return parser, args, code, stdout.getvalue(), stderr.getvalue()
+
+    def test_known_command(self):
+        parser, args, code, _, _ = self.parse(['listchannels', 'rebalance'])
+        self.assertIsNone(code)
+        self.assertEqual('listchannels', args.cmd)
+        self.assertEqual('rebalance', args.subcmd)
+        # only the subparser of the requested command is built
+        self.assertTrue(hasattr(parser, 'parser_listchannels'))
+        self.assertFalse(hasattr(parser, 'parser_update_fees'))
+
+    def test_options_before_command(self):
+        for argv in (
+            ['--loglevel', 'DEBUG', 'status'],
+            ['--loglevel=DEBUG', 'status'],
+            ['--log', 'DEBUG', 'status'],
+        ):
+            parser, args, code, _, _ = self.parse(argv)
+            self.assertIsNone(code)
+            self.assertEqual('status', args.cmd)
+            self.assertEqual('DEBUG', args.loglevel)
+            self.assertFalse(hasattr(parser, 'parser_update_fees'))
+
+    def test_sniff_subcommand(self):
+        choices = {'info', 'status'}
+        options = ('--loglevel',)
+        # option values and later positional arguments are no commands
+        self.assertEqual(
+            ('status', 2),
+            _sniff_subcommand(['--loglevel', 'info', 'status'], choices, options))
+        self.assertEqual(
+            ('status', 0),
+            _sniff_subcommand(['status', 'info'], choices, options))
+        # the first positional argument is no known command
+        self.assertEqual(
+            (None, None),
+            _sniff_subcommand(['unknown', 'status'], choices, options))
+        self.assertEqual((None, None), _sniff_subcommand(None, choices))
+
+    def test_unknown_command(self):
+        _, args, code, stdout, stderr = self.parse(['unknown-command'])
+        self.assertIsNone(args)
+        self.assertEqual(2, code)
+        self.assertIn("invalid choice: 'unknown-command'", stderr)
+        # all commands are offered as choices
+        self.assertIn('update-fees', stderr)
+
+    def test_help_without_command(self):
+        _, _, code, stdout, _ = self.parse(['-h'])
+        self.assertEqual(0, code)
+        for cmd in ('status', 'listchannels', 'recommend-nodes', 'update-fees'):
+            self.assertIn(cmd, stdout)
+
+    def test_help_with_command(self):
+        _, _, code, stdout, _ = self.parse(['update-fees', '-h'])
+        self.assertEqual(0, code)
+        self.assertIn('usage: lndmanage.py update-fees', stdout)
+        self.assertIn('--from-days-ago', stdout)
+
+        # help before the command is the general help
+        _, _, code, stdout, _ = self.parse(['-h', 'update-fees'])
+        self.assertEqual(0, code)
+        self.assertIn('usage: lndmanage.py [-h]', stdout)
+
+    def test_recommend_nodes_without_subcommand(self):
+        parser, args, code, _, _ = self.parse(['recommend-nodes'])
+        self.assertIsNone(code)
+        self.assertEqual('recommend-nodes', args.cmd)
+        self.assertIsNone(args.subcmd)
+        # the help shown in this case lists all subcommands
+        help_text = parser.parser_recommend_nodes.format_help()
+        for subcmd in RECOMMEND_NODES_SUBCOMMANDS:
+            self.assertIn(subcmd, help_text)
+
+    def test_recommend_nodes_with_subcommand(self):
+        _, args, code, _, _ = self.parse(
+            ['recommend-nodes', 'flow-analysis', '--inwards'])
+        self.assertIsNone(code)
+        self.assertEqual('flow-analysis', args.subcmd)
+        self.assertTrue(args.inwards)
+
+        # a subcommand name as a later value doesn't select that subcommand
+        _, args, code, _, _ = self.parse(
+            ['recommend-nodes', '--show-connected', 'good-old', '--sort-by',
+             'flow-analysis'])
+        self.assertIsNone(code)
+        self.assertEqual('good-old', args.subcmd)
+
+    def test_version(self):
+        _, _, code, stdout, _ = self.parse(['--version'])
+        self.assertEqual(0, code)
+        self.assertIn(__version__, stdout)